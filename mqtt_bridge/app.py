@@ -0,0 +1,94 @@
+
+from __future__ import unicode_literals
+import os
+import sys
+import logging
+from configparser import ConfigParser
+import paho.mqtt.client as mqtt
+
+# The shared mqtt_ingest package and the bridges live next to this directory
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mqtt_ingest.core import Ingest
+from mqtt_ingest.queued import QueuedSink
+from mqtt_ingest.shared import worker_args, WorkerRole
+from sinks import create_sink
+
+
+console_out = logging.StreamHandler(sys.stdout)
+console_out.setLevel(logging.DEBUG)
+console_err = logging.StreamHandler(sys.stderr)
+console_err.setLevel(logging.ERROR)
+logging_handlers = [console_out, console_err]
+logging_format = '%(asctime)s %(filename)s[line:%(lineno)d] %(levelname)s %(message)s'
+logging_datefmt = '%a, %d %b %Y %H:%M:%S'
+## INFO Log Level. or opcua module will append tooooooo much logs
+logging.basicConfig(level=logging.INFO, format=logging_format, datefmt=logging_datefmt, handlers=logging_handlers)
+
+
+config = ConfigParser()
+config.read('../config.ini')
+mqtt_host = config.get('mqtt', 'host', fallback='127.0.0.1')
+mqtt_port = config.getint('mqtt', 'port', fallback=1883)
+mqtt_user = config.get('mqtt', 'user', fallback='root')
+mqtt_password = config.get('mqtt', 'password', fallback='root')
+mqtt_keepalive = config.getint('mqtt', 'keepalive', fallback=60)
+mqtt_json_backend = config.get('mqtt', 'json_backend', fallback='auto')
+mqtt_share_dispatch = config.get('mqtt', 'share_dispatch', fallback='broker')
+mqtt_share_affinity = config.getboolean('mqtt', 'share_affinity', fallback=False)
+bridge_sinks = config.get('bridge', 'sinks', fallback='redis,influxdb')
+bridge_queue_size = config.getint('bridge', 'queue_size', fallback=10240)
+bridge_event_queue_size = config.getint('bridge', 'event_queue_size', fallback=1024)
+
+worker_index, worker_count = worker_args()
+worker_role = WorkerRole("THINGSROOT_MQTT_BRIDGE", worker_index, worker_count, dispatch=mqtt_share_dispatch,
+						broker_affinity=mqtt_share_affinity)
+
+ingest = Ingest(json_backend=mqtt_json_backend)
+for name in bridge_sinks.split(','):
+	name = name.strip()
+	if not name:
+		continue
+	logging.info('Bridge sink %s', name)
+	sink = QueuedSink(name, create_sink(config, name, instance=worker_role.instance, device_affinity=worker_role.device_affinity),
+						maxlen=bridge_queue_size, event_maxlen=bridge_event_queue_size)
+	sink.start()
+	ingest.register(sink)
+worker_role.apply(ingest)
+
+
+# The callback for when the client receives a CONNACK response from the server.
+def on_connect(client, userdata, flags, rc):
+	logging.info("Main MQTT Connected with result code "+str(rc))
+
+	# Subscribing in on_connect() means that if we lose the connection and
+	# reconnect then subscriptions will be renewed.
+	if rc != 0:
+		return
+
+	logging.info("Main MQTT Subscribe topics")
+	for topic in worker_role.subscriptions(ingest):
+		client.subscribe(topic)
+
+
+def on_disconnect(client, userdata, rc):
+	logging.error("Main MQTT Disconnect with result code "+str(rc))
+
+
+# One subscription for all the sinks, every message is decoded once
+client = mqtt.Client(client_id=worker_role.client_id)
+client.username_pw_set(mqtt_user, mqtt_password)
+client.on_connect = on_connect
+client.on_disconnect = on_disconnect
+client.on_message = ingest.on_message
+
+try:
+	logging.debug('MQTT Connect to %s:%d', mqtt_host, mqtt_port)
+	client.connect_async(mqtt_host, mqtt_port, mqtt_keepalive)
+
+	# Blocking call that processes network traffic, dispatches callbacks and
+	# handles reconnecting.
+	client.loop_forever(retry_first_connection=True)
+except Exception as ex:
+	logging.exception(ex)
+	os._exit(1)
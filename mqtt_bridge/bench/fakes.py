@@ -0,0 +1,216 @@
+import gzip
+import json
+import time
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse
+try:
+	import zstandard
+except ImportError:
+	zstandard = None
+
+
+SYSTEM_MEASUREMENTS = (b'iot_device,', b'device_status,')
+
+
+class Latency:
+	''' End-to-end latency samples (seconds), taken where a sink stand-in receives the value '''
+	def __init__(self):
+		self.samples = []
+		self.last_at = None
+
+	def add(self, timestamp):
+		# list.append is atomic, stand-ins call it from their own threads
+		self.samples.append(time.time() - timestamp)
+		self.last_at = time.monotonic()
+
+	def summary(self):
+		samples = sorted(self.samples)
+		if not samples:
+			return {"samples": 0}
+
+		def percentile(q):
+			return samples[int(q * (len(samples) - 1))] * 1000
+
+		return {
+			"samples": len(samples),
+			"p50": percentile(0.5),
+			"p99": percentile(0.99),
+			"max": samples[-1] * 1000,
+		}
+
+
+class FakeScript:
+	''' Registered Lua script stand-in, only counts calls '''
+	def __init__(self, redis):
+		self.redis = redis
+
+	def __call__(self, keys=None, args=None, client=None):
+		target = client or self.redis
+		target.count('evalsha')
+		if client is not None:
+			client.commands.append(lambda: 0)
+		return 0
+
+
+class FakePipeline:
+	def __init__(self, redis):
+		self.redis = redis
+		self.commands = []
+
+	def count(self, command):
+		self.redis.count(command)
+
+	def __getattr__(self, name):
+		method = getattr(self.redis, name)
+
+		def queue(*args, **kwargs):
+			self.commands.append(lambda: method(*args, **kwargs))
+			return self
+		return queue
+
+	def execute(self):
+		self.redis.count('pipeline')
+		commands, self.commands = self.commands, []
+		return [command() for command in commands]
+
+
+class FakeRedis:
+	''' In-process stand-in of the redis client commands the bridges use
+
+	HSET values are decoded with the RTDB codec (decode) to take the latency of their timestamps.
+	'''
+	def __init__(self, latency=None, decode=None):
+		self.latency = latency
+		self.decode = decode
+		self.hashes = {}
+		self.values = {}
+		self.commands = {}
+		self.lock = threading.Lock()
+
+	def count(self, command):
+		self.commands[command] = self.commands.get(command, 0) + 1
+
+	def pipeline(self, transaction=False):
+		return FakePipeline(self)
+
+	def register_script(self, script):
+		return FakeScript(self)
+
+	def hset(self, name, key=None, value=None, mapping=None):
+		self.count('hset')
+		with self.lock:
+			values = self.hashes.setdefault(name, {})
+			if key is not None:
+				values[key] = value
+			if mapping:
+				values.update(mapping)
+		if self.latency is not None and self.decode and mapping:
+			for value in mapping.values():
+				self.latency.add(self.decode(value)[0])
+		return len(mapping or ()) + (key is not None)
+
+	def hgetall(self, name):
+		self.count('hgetall')
+		return dict(self.hashes.get(name, {}))
+
+	def smembers(self, name):
+		self.count('smembers')
+		return set()
+
+	def set(self, name, value):
+		self.count('set')
+		self.values[name] = value
+		return True
+
+	def get(self, name):
+		self.count('get')
+		return self.values.get(name)
+
+	def publish(self, channel, message):
+		self.count('publish')
+		return 0
+
+	def xadd(self, name, fields, maxlen=None, approximate=True):
+		self.count('xadd')
+
+	def xtrim(self, name, minid=None, approximate=True):
+		self.count('xtrim')
+
+	def persist(self, name):
+		self.count('persist')
+
+	def expire(self, name, seconds):
+		self.count('expire')
+
+	def scan_iter(self, match=None, count=None):
+		return iter(list(self.hashes) + list(self.values))
+
+
+class FakeInfluxDB(threading.Thread):
+	''' Local HTTP endpoint answering /ping, /query and /write of InfluxDB 1.x
+
+	Written lines (gzip or zstd bodies too) are counted, their ms timestamps give the latency.
+	'''
+	def __init__(self, latency=None, host='127.0.0.1', port=0):
+		threading.Thread.__init__(self, name='FakeInfluxDB')
+		self.daemon = True
+		self.latency = latency
+		self.requests = 0
+		self.points = 0
+		self.bytes = 0
+		self.lock = threading.Lock()
+		fake = self
+
+		class Handler(BaseHTTPRequestHandler):
+			def log_message(self, format, *args):
+				pass
+
+			def do_GET(self):
+				self.reply(urlparse(self.path).path)
+
+			def do_POST(self):
+				path = urlparse(self.path).path
+				body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+				if path == '/write':
+					fake.write(body, self.headers.get('Content-Encoding'))
+				self.reply(path)
+
+			def reply(self, path):
+				if path == '/query':
+					content = json.dumps({"results": [{"statement_id": 0}]}).encode('utf-8')
+					self.send_response(200)
+					self.send_header('Content-Type', 'application/json')
+					self.send_header('Content-Length', str(len(content)))
+					self.end_headers()
+					self.wfile.write(content)
+					return
+				self.send_response(204)
+				self.send_header('Content-Length', '0')
+				self.end_headers()
+
+		self.server = ThreadingHTTPServer((host, port), Handler)
+		self.host, self.port = self.server.server_address[:2]
+
+	def write(self, body, encoding):
+		with self.lock:
+			self.requests += 1
+			self.bytes += len(body)
+		if encoding == 'gzip':
+			body = gzip.decompress(body)
+		elif encoding == 'zstd' and zstandard:
+			body = zstandard.ZstdDecompressor().decompressobj().decompress(body)
+		for line in body.split(b'\n'):
+			if not line:
+				continue
+			with self.lock:
+				self.points += 1
+			# Device info and status are stamped by the bridge, not the gateway
+			if self.latency is not None and not line.startswith(SYSTEM_MEASUREMENTS):
+				self.latency.add(int(line.rsplit(b' ', 1)[1]) / 1000.0)
+
+	def run(self):
+		self.server.serve_forever()
+
+	def stop(self):
+		self.server.shutdown()
@@ -0,0 +1,76 @@
+import json
+import time
+import random
+
+
+MODELS = 5
+
+
+class Fleet:
+	''' Synthetic gateways with devices and typed inputs, producing (topic, payload) the way gateways publish them
+
+	Data timestamps are the publish time, so the sinks can tell the end-to-end latency.
+	'''
+	def __init__(self, gateways=100, devices=10, inputs=20, event_ratio=0.001, seed=1):
+		self.random = random.Random(seed)
+		self.gateways = ['BENCH_GATE_%05d' % g for g in range(gateways)]
+		self.devices = [(gate, '%s.DEV_%02d' % (gate, d)) for gate in self.gateways for d in range(devices)]
+		self.inputs = []
+		for i in range(inputs):
+			r = i % 10
+			vt = 'string' if r == 9 else ('int' if r >= 6 else None)
+			self.inputs.append(('tag_%02d' % i, vt))
+		self.event_ratio = event_ratio
+
+	def describe(self):
+		return {
+			"gateways": len(self.gateways),
+			"devices": len(self.devices),
+			"inputs": len(self.inputs),
+			"event_ratio": self.event_ratio,
+		}
+
+	def device_info(self, index):
+		inputs = []
+		for name, vt in self.inputs:
+			it = {"name": name, "desc": name}
+			if vt:
+				it["vt"] = vt
+			inputs.append(it)
+		return {
+			"meta": {"name": "BENCH_MODEL_%d" % (index % MODELS), "description": "benchmark device"},
+			"inputs": inputs,
+			"outputs": [],
+			"commands": [],
+		}
+
+	def device_messages(self):
+		for index, (gate, dev) in enumerate(self.devices):
+			yield dev + '/device', json.dumps({"gate": gate, "info": self.device_info(index)}).encode('utf-8')
+
+	def status_messages(self, status='ONLINE'):
+		for gate in self.gateways:
+			yield gate + '/status', json.dumps({"gate": gate, "status": status}).encode('utf-8')
+
+	def value(self, vt):
+		rnd = self.random
+		if vt == 'string':
+			return '"state %d"' % rnd.randint(0, 9)
+		if vt == 'int':
+			return str(rnd.randint(0, 65535))
+		return '%.3f' % (rnd.random() * 100)
+
+	def data_messages(self, count):
+		''' count data messages (and events by event_ratio), round robin over devices and inputs '''
+		rnd = self.random
+		devices = self.devices
+		inputs = self.inputs
+		for i in range(count):
+			gate, dev = devices[i % len(devices)]
+			if self.event_ratio and rnd.random() < self.event_ratio:
+				event = json.dumps([dev, {"level": 1, "type": "bench", "info": "benchmark event"}, time.time()])
+				yield dev + '/event', json.dumps({"gate": gate, "event": event}).encode('utf-8')
+				continue
+			name, vt = inputs[(i // len(devices)) % len(inputs)]
+			payload = '{"input":"%s/value","data":[%.6f,%s,0]}' % (name, time.time(), self.value(vt))
+			yield dev + '/data', payload.encode('utf-8')
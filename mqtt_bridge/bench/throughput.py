@@ -0,0 +1,267 @@
+''' Bridge throughput: synthetic gateway fleet -> ingest core -> bridge sinks -> in-process stand-ins
+
+Redis is replaced by an in-process fake and InfluxDB by a local HTTP endpoint, the OPC UA sink runs a real server.
+Messages are handed to Ingest.handle directly, or published through a (local, NOT production) broker with --broker.
+The JSON result has the data throughput, p50/p99/max end-to-end latency per sink (gateway timestamp to the value
+reaching the stand-in) and CPU / RSS of this process (stand-ins and publisher included).
+
+Usage (in mqtt_bridge folder): python3 -m bench.throughput [--sinks redis,influxdb] [--messages 100000] [--rate 0]
+	[--gateways 100] [--devices 10] [--inputs 20] [--broker 127.0.0.1:1883] [--output result.json]
+'''
+from __future__ import unicode_literals
+import os
+import sys
+import json
+import time
+import resource
+import argparse
+import threading
+from configparser import ConfigParser
+
+base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(base_dir)
+
+from mqtt_ingest.core import Ingest
+from mqtt_ingest.queued import QueuedSink
+from bench.fleet import Fleet
+from bench.fakes import Latency, FakeRedis, FakeInfluxDB
+
+
+def create_redis_sink(config, latency):
+	sys.path.append(os.path.join(base_dir, 'mqtt_to_redis'))
+	from rtdb.writer import Writer
+	from rtdb.relation import Relation
+	from rtdb.sink import RedisSink
+	from mqtt_ingest.rtdb_codec import Codec, decode
+
+	fake = FakeRedis(latency, decode)
+	writer = Writer(fake, flush_interval=config.getfloat('redis', 'flush_interval', fallback=0.005),
+					flush_entries=config.getint('redis', 'flush_entries', fallback=1000))
+	writer.start()
+	codec = Codec(config.get('redis', 'rtdb_encoding', fallback='json'))
+	return RedisSink(writer, Relation(fake, fake, fake, fake), codec, fake, fake, 3600), fake.commands
+
+
+def create_influxdb_sink(config, latency):
+	sys.path.append(os.path.join(base_dir, 'mqtt_to_influxdb'))
+	from tsdb.bridge import create_sink
+
+	fake = FakeInfluxDB(latency)
+	fake.start()
+	config.set('influxdb', 'host', fake.host)
+	config.set('influxdb', 'port', str(fake.port))
+	config.remove_option('influxdb', 'wal_dir')
+	config.remove_option('influxdb', 'dead_letter_dir')
+	return create_sink(config), fake
+
+
+def create_opcua_sink(config, latency):
+	sys.path.append(os.path.join(base_dir, 'mqtt_to_opcua'))
+	from ioe.handler import MQTTHandler
+	from ioe.mqtt_client import HandlerSink
+
+	handler = MQTTHandler(FakeRedis(), FakeRedis(), FakeRedis(), None)
+	handler.start()
+	handler_data = handler.data
+
+	def data(**kwargs):
+		handler_data(**kwargs)
+		latency.add(kwargs['timestamp'])
+
+	handler.data = data
+	return HandlerSink(handler), handler
+
+
+SINK_FACTORIES = {
+	'redis': create_redis_sink,
+	'influxdb': create_influxdb_sink,
+	'opcua': create_opcua_sink,
+}
+
+
+def store_stats(name, store):
+	if name == 'redis':
+		return dict(store)
+	if name == 'influxdb':
+		return {"requests": store.requests, "points": store.points, "bytes": store.bytes}
+	return {}
+
+
+class DirectFeed:
+	''' Hand messages to the ingest core in this thread, as the paho network thread does '''
+	def __init__(self, ingest):
+		self.ingest = ingest
+
+	def publish(self, topic, payload):
+		self.ingest.handle(topic, payload, 0)
+
+	def close(self):
+		pass
+
+
+class BrokerFeed:
+	''' Publish through a broker, one client subscribed with the ingest core and one publishing '''
+	def __init__(self, ingest, broker, user=None, password=None):
+		import paho.mqtt.client as mqtt
+		host, _, port = broker.partition(':')
+		port = int(port or 1883)
+		subscribed = threading.Event()
+
+		def on_connect(client, userdata, flags, rc):
+			for topic in ingest.subscriptions():
+				client.subscribe(topic)
+			subscribed.set()
+
+		self.sub = mqtt.Client(client_id='THINGSROOT_BENCH_SUB')
+		self.pub = mqtt.Client(client_id='THINGSROOT_BENCH_PUB')
+		for client in (self.sub, self.pub):
+			if user:
+				client.username_pw_set(user, password)
+		self.sub.on_connect = on_connect
+		self.sub.on_message = ingest.on_message
+		self.sub.connect(host, port)
+		self.sub.loop_start()
+		if not subscribed.wait(10):
+			raise RuntimeError('Can not subscribe at broker ' + broker)
+		time.sleep(0.5)
+		self.pub.connect(host, port)
+		self.pub.loop_start()
+
+	def publish(self, topic, payload):
+		self.pub.publish(topic, payload, qos=0)
+
+	def close(self):
+		self.pub.loop_stop()
+		self.sub.loop_stop()
+
+
+def feed(feeder, messages, rate):
+	start = time.monotonic()
+	count = 0
+	for topic, payload in messages:
+		feeder.publish(topic, payload)
+		count += 1
+		if rate and count % 100 == 0:
+			delay = start + count / rate - time.monotonic()
+			if delay > 0:
+				time.sleep(delay)
+	return count
+
+
+def wait_drained(latencies, idle, timeout):
+	''' Wait until no sink stand-in received a value for idle seconds, return the time of the last one '''
+	deadline = time.monotonic() + timeout
+	while time.monotonic() < deadline:
+		last = max([latency.last_at or 0 for latency in latencies.values()])
+		if last and time.monotonic() - last >= idle:
+			return last
+		time.sleep(0.1)
+	return time.monotonic()
+
+
+def rss_mb():
+	try:
+		with open('/proc/self/statm') as f:
+			return int(f.read().split()[1]) * resource.getpagesize() / 1024.0 / 1024.0
+	except (IOError, OSError, IndexError, ValueError):
+		return None
+
+
+def main():
+	parser = argparse.ArgumentParser(description='Bridge throughput benchmark')
+	parser.add_argument('--sinks', default='redis,influxdb', help='comma separated: redis, influxdb, opcua')
+	parser.add_argument('--messages', type=int, default=100000, help='data messages to send')
+	parser.add_argument('--rate', type=float, default=0, help='messages per second, 0 is as fast as possible')
+	parser.add_argument('--gateways', type=int, default=100)
+	parser.add_argument('--devices', type=int, default=10, help='devices per gateway')
+	parser.add_argument('--inputs', type=int, default=20, help='inputs per device')
+	parser.add_argument('--event-ratio', type=float, default=0.001)
+	parser.add_argument('--queued', action='store_true', help='run sinks behind QueuedSink (always for more than one sink)')
+	parser.add_argument('--json-backend', default='auto')
+	parser.add_argument('--broker', default=None, help='host:port of a local broker, messages are sent directly without it')
+	parser.add_argument('--user', default=None)
+	parser.add_argument('--password', default=None)
+	parser.add_argument('--idle', type=float, default=2.0, help='seconds without writes taken as drained')
+	parser.add_argument('--timeout', type=float, default=120.0)
+	parser.add_argument('--output', default=None, help='write the JSON result to file too')
+	args = parser.parse_args()
+
+	config = ConfigParser()
+	config.read('../config.ini')
+	for section in ('redis', 'influxdb'):
+		if not config.has_section(section):
+			config.add_section(section)
+
+	names = [name.strip() for name in args.sinks.split(',') if name.strip()]
+	queued = args.queued or len(names) > 1
+	ingest = Ingest(json_backend=args.json_backend)
+	latencies = {}
+	stores = {}
+	for name in names:
+		latencies[name] = Latency()
+		sink, stores[name] = SINK_FACTORIES[name](config, latencies[name])
+		if queued:
+			sink = QueuedSink(name, sink)
+			sink.start()
+		ingest.register(sink)
+
+	fleet = Fleet(args.gateways, args.devices, args.inputs, event_ratio=args.event_ratio)
+	feeder = BrokerFeed(ingest, args.broker, args.user, args.password) if args.broker else DirectFeed(ingest)
+
+	# Devices and gateways first, they are not part of the measurement
+	feed(feeder, fleet.device_messages(), 0)
+	feed(feeder, fleet.status_messages(), 0)
+	time.sleep(1)
+	for latency in latencies.values():
+		latency.samples = []
+		latency.last_at = None
+	received_start, failed_start = ingest.received, ingest.failed
+
+	usage_start = resource.getrusage(resource.RUSAGE_SELF)
+	start = time.monotonic()
+	sent = feed(feeder, fleet.data_messages(args.messages), args.rate)
+	sent_at = time.monotonic()
+	drained_at = wait_drained(latencies, args.idle, args.timeout)
+	usage_end = resource.getrusage(resource.RUSAGE_SELF)
+	feeder.close()
+
+	elapsed = max(drained_at, sent_at) - start
+	cpu_user = usage_end.ru_utime - usage_start.ru_utime
+	cpu_system = usage_end.ru_stime - usage_start.ru_stime
+	result = {
+		"time": time.time(),
+		"mode": "broker" if args.broker else "direct",
+		"sinks": names,
+		"queued": queued,
+		"json_backend": ingest.json_backend,
+		"fleet": fleet.describe(),
+		"rate": args.rate,
+		"messages": sent,
+		"send_seconds": sent_at - start,
+		"elapsed_seconds": elapsed,
+		"throughput": sent / elapsed if elapsed > 0 else None,
+		"ingest": {"received": ingest.received - received_start, "failed": ingest.failed - failed_start},
+		"latency_ms": dict((name, latency.summary()) for name, latency in latencies.items()),
+		"stores": dict((name, store_stats(name, store)) for name, store in stores.items()),
+		"cpu": {
+			"user": cpu_user,
+			"system": cpu_system,
+			"percent": (cpu_user + cpu_system) * 100 / elapsed if elapsed > 0 else None,
+		},
+		"rss_mb": {
+			"current": rss_mb(),
+			"max": usage_end.ru_maxrss / 1024.0,
+		},
+	}
+
+	content = json.dumps(result, indent=2, sort_keys=True)
+	print(content)
+	if args.output:
+		with open(args.output, 'w') as f:
+			f.write(content + '\n')
+	# Sink threads are daemons, the stand-in servers too
+	os._exit(0)
+
+
+if __name__ == '__main__':
+	main()
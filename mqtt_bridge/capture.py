@@ -0,0 +1,141 @@
+import os
+import struct
+
+
+''' Capture file: magic, then records of <timestamp, topic length, payload length, flags> + topic + payload.
+The .idx file next to it holds <timestamp, offset, message number> of every index_every-th record,
+both are append only. A record cut by a crash at the end is ignored by the reader.
+'''
+MAGIC = b'MQTTCAP1'
+RECORD = struct.Struct('<dHIB')
+INDEX = struct.Struct('<dQQ')
+FLAG_RETAIN = 0x01
+
+
+class CaptureWriter:
+	''' Append records to a capture file, an existing one is continued after its last complete record '''
+	def __init__(self, path, index_every=1000):
+		self.path = path
+		self.index_every = index_every
+		self.count = 0
+		self.offset = len(MAGIC)
+		if os.path.exists(path) and os.path.getsize(path) > 0:
+			reader = CaptureReader(path)
+			self.count, self.offset = reader.tail()
+			with open(path, 'r+b') as f:
+				f.truncate(self.offset)
+			index_path = path + '.idx'
+			if os.path.exists(index_path):
+				# tail() dropped the entries of records that never made it to the capture file
+				with open(index_path, 'r+b') as f:
+					f.truncate(len(reader.index) * INDEX.size)
+		self.file = open(path, 'ab')
+		self.index = open(path + '.idx', 'ab')
+		if self.file.tell() == 0:
+			self.file.write(MAGIC)
+
+	def write(self, timestamp, topic, payload, retain=0):
+		if isinstance(topic, str):
+			topic = topic.encode('utf-8')
+		if self.count % self.index_every == 0:
+			self.index.write(INDEX.pack(timestamp, self.offset, self.count))
+		header = RECORD.pack(timestamp, len(topic), len(payload), FLAG_RETAIN if retain else 0)
+		self.file.write(header)
+		self.file.write(topic)
+		self.file.write(payload)
+		self.offset += len(header) + len(topic) + len(payload)
+		self.count += 1
+
+	def flush(self):
+		self.file.flush()
+		self.index.flush()
+
+	def close(self):
+		self.flush()
+		self.file.close()
+		self.index.close()
+
+
+class CaptureReader:
+	''' Iterate (timestamp, topic, payload, retain) of a capture file '''
+	def __init__(self, path):
+		self.path = path
+		self.index = []
+		try:
+			with open(path + '.idx', 'rb') as f:
+				data = f.read()
+			for pos in range(0, len(data) - INDEX.size + 1, INDEX.size):
+				self.index.append(INDEX.unpack_from(data, pos))
+		except FileNotFoundError:
+			pass
+
+	def tail(self):
+		''' (message count, end offset of the last complete record)
+
+		The index is written ahead of its record, entries past the last complete record are dropped.
+		'''
+		size = os.path.getsize(self.path)
+		while self.index and self.index[-1][1] >= size:
+			self.index.pop()
+		while True:
+			count, offset = 0, len(MAGIC)
+			if self.index:
+				timestamp, offset, count = self.index[-1]
+			scanned = 0
+			for end, record in self.records(self.path, offset):
+				scanned += 1
+				offset = end
+			if scanned or not self.index:
+				return count + scanned, offset
+			# The indexed record itself was cut, rescan from the entry before
+			self.index.pop()
+
+	def start_offset(self, start=None):
+		''' Offset of the last indexed record at or before start timestamp '''
+		offset = len(MAGIC)
+		if start is None:
+			return offset
+		for timestamp, record_offset, count in self.index:
+			if timestamp > start:
+				break
+			offset = record_offset
+		return offset
+
+	def first_timestamp(self):
+		if self.index:
+			return self.index[0][0]
+		for record in self.scan(self.path, len(MAGIC)):
+			return record[0]
+		return None
+
+	@staticmethod
+	def records(path, offset):
+		''' (end offset, record) from offset on '''
+		with open(path, 'rb') as f:
+			if f.read(len(MAGIC)) != MAGIC:
+				raise ValueError('Not a capture file: ' + path)
+			f.seek(offset)
+			while True:
+				header = f.read(RECORD.size)
+				if len(header) < RECORD.size:
+					return
+				timestamp, topic_len, payload_len, flags = RECORD.unpack(header)
+				topic = f.read(topic_len)
+				payload = f.read(payload_len)
+				if len(topic) < topic_len or len(payload) < payload_len:
+					return
+				yield f.tell(), (timestamp, topic.decode('utf-8'), payload, flags & FLAG_RETAIN)
+
+	@staticmethod
+	def scan(path, offset):
+		for end, record in CaptureReader.records(path, offset):
+			yield record
+
+	def __iter__(self):
+		return self.scan(self.path, len(MAGIC))
+
+	def read(self, start=None):
+		''' Records from start timestamp on '''
+		for record in self.scan(self.path, self.start_offset(start)):
+			if start is None or record[0] >= start:
+				yield record
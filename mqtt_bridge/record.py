@@ -0,0 +1,81 @@
+''' Record MQTT traffic into a capture file (see capture.py), replay it with replay.py
+
+Usage (in mqtt_bridge folder): python3 record.py --output traffic.cap [--topic +/#] [--duration 3600]
+'''
+from __future__ import unicode_literals
+import sys
+import time
+import argparse
+import logging
+from configparser import ConfigParser
+import paho.mqtt.client as mqtt
+from capture import CaptureWriter
+
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s', handlers=[logging.StreamHandler(sys.stdout)])
+
+
+class Recorder:
+	def __init__(self, writer, topics, flush_interval=1.0):
+		self.writer = writer
+		self.topics = topics
+		self.flush_interval = flush_interval
+		self.flush_at = time.monotonic() + flush_interval
+		self.received = 0
+
+	def on_connect(self, client, userdata, flags, rc):
+		logging.info("MQTT Connected with result code " + str(rc))
+		if rc != 0:
+			return
+		for topic in self.topics:
+			client.subscribe(topic)
+
+	def on_message(self, client, userdata, msg):
+		self.writer.write(time.time(), msg.topic, msg.payload, msg.retain)
+		self.received += 1
+		if time.monotonic() >= self.flush_at:
+			self.writer.flush()
+			self.flush_at = time.monotonic() + self.flush_interval
+
+
+def main():
+	parser = argparse.ArgumentParser(description='Record MQTT traffic into a capture file')
+	parser.add_argument('--config', default='../config.ini')
+	parser.add_argument('--output', required=True, help='capture file, appended when it exists')
+	parser.add_argument('--topic', action='append', help='topic filter, default +/#')
+	parser.add_argument('--duration', type=float, default=0, help='seconds to record, 0 is until interrupted')
+	parser.add_argument('--index-every', type=int, default=1000, help='index one of every N messages')
+	args = parser.parse_args()
+
+	config = ConfigParser()
+	config.read(args.config)
+	mqtt_host = config.get('mqtt', 'host', fallback='127.0.0.1')
+	mqtt_port = config.getint('mqtt', 'port', fallback=1883)
+	mqtt_user = config.get('mqtt', 'user', fallback='root')
+	mqtt_password = config.get('mqtt', 'password', fallback='root')
+	mqtt_keepalive = config.getint('mqtt', 'keepalive', fallback=60)
+
+	writer = CaptureWriter(args.output, index_every=args.index_every)
+	recorder = Recorder(writer, args.topic or ['+/#'])
+	client = mqtt.Client(client_id="THINGSROOT_MQTT_RECORDER")
+	client.username_pw_set(mqtt_user, mqtt_password)
+	client.on_connect = recorder.on_connect
+	client.on_message = recorder.on_message
+	client.connect_async(mqtt_host, mqtt_port, mqtt_keepalive)
+	client.loop_start()
+
+	start = time.monotonic()
+	try:
+		while not args.duration or time.monotonic() - start < args.duration:
+			remaining = args.duration - (time.monotonic() - start) if args.duration else 10
+			time.sleep(max(min(10, remaining), 0))
+			logging.info('Recorded %d messages', recorder.received)
+	except KeyboardInterrupt:
+		pass
+	client.loop_stop()
+	writer.close()
+	logging.info('Recorded %d messages into %s (%d in total)', recorder.received, args.output, writer.count)
+
+
+if __name__ == '__main__':
+	main()
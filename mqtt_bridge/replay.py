@@ -0,0 +1,199 @@
+''' Replay a capture file (see record.py) into a broker or straight into the bridge sinks
+
+--speed 1 keeps the recorded pace, N is N times faster and 0 is as fast as possible.
+--copies N replays every message N times, copy i > 0 with device and gateway ids renamed by --remap,
+which multiplies the fleet size. Direct replay (--sinks) uses the real sinks of config.ini, like mqtt_bridge.
+
+Usage (in mqtt_bridge folder): python3 replay.py traffic.cap (--broker 127.0.0.1:1883 | --sinks redis,influxdb)
+	[--speed 1] [--copies 1] [--remap {id}_R{copy}] [--start 0] [--loop]
+'''
+from __future__ import unicode_literals
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+from configparser import ConfigParser
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mqtt_ingest.core import Ingest
+from mqtt_ingest.queued import QueuedSink
+from capture import CaptureReader
+from sinks import create_sink
+
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s', handlers=[logging.StreamHandler(sys.stdout)])
+
+
+class Remapper:
+	''' Rename device / gateway ids of topics and payloads for the copies of a message '''
+	def __init__(self, copies=1, remap='{id}_R{copy}'):
+		self.copies = max(copies, 1)
+		self.remap = remap
+		self.names = {}
+
+	def rename(self, id, copy):
+		key = (id, copy)
+		name = self.names.get(key)
+		if name is None:
+			name = self.remap.format(id=id, copy=copy)
+			self.names[key] = name
+		return name
+
+	def remap_payload(self, kind, payload, copy):
+		if kind == 'data':
+			# Data payloads carry no ids
+			return payload
+		data = json.loads(payload.decode('utf-8', 'surrogatepass'))
+		if not isinstance(data, dict):
+			return payload
+		if data.get('gate'):
+			data['gate'] = self.rename(data['gate'], copy)
+		info = data.get('info')
+		if kind == 'device' and isinstance(info, dict) and 'meta' not in info and 'inputs' not in info:
+			# Info of many devices (see DeviceRecord.devices), keyed by device id
+			data['info'] = dict((self.rename(dev, copy), dev_info) for dev, dev_info in info.items())
+		if kind == 'event' and isinstance(data.get('event'), str):
+			event = json.loads(data['event'])
+			if isinstance(event, list) and event and isinstance(event[0], str):
+				event[0] = self.rename(event[0], copy)
+				data['event'] = json.dumps(event)
+		return json.dumps(data).encode('utf-8')
+
+	def messages(self, topic, payload):
+		yield topic, payload
+		if self.copies == 1:
+			return
+		device, sep, kind = topic.partition('/')
+		for copy in range(1, self.copies):
+			try:
+				yield self.rename(device, copy) + sep + kind, self.remap_payload(kind, payload, copy)
+			except ValueError as ex:
+				logging.warning('Can not remap %s: %r', topic, ex)
+
+
+class BrokerTarget:
+	def __init__(self, broker, user, password):
+		import paho.mqtt.client as mqtt
+		host, _, port = broker.partition(':')
+		self.client = mqtt.Client(client_id="THINGSROOT_MQTT_REPLAY")
+		self.client.username_pw_set(user, password)
+		self.client.connect(host, int(port or 1883))
+		self.client.loop_start()
+		self.last = None
+		self.sent = 0
+
+	def send(self, topic, payload, retain):
+		self.sent += 1
+		self.last = self.client.publish(topic, payload, qos=0, retain=bool(retain))
+
+	def close(self, timeout):
+		''' Wait until the last message left the client (they are sent in order), then disconnect '''
+		deadline = time.monotonic() + timeout
+		while self.last is not None and not self.last.is_published() and time.monotonic() < deadline:
+			time.sleep(0.05)
+		self.client.disconnect()
+		self.client.loop_stop()
+
+
+class SinkTarget:
+	def __init__(self, config, names, queued, json_backend):
+		self.ingest = Ingest(json_backend=json_backend)
+		self.sinks = []
+		for name in names:
+			sink = create_sink(config, name)
+			if queued:
+				sink = QueuedSink(name, sink)
+				sink.start()
+			self.ingest.register(sink)
+			self.sinks.append(sink)
+		self.sent = 0
+
+	def send(self, topic, payload, retain):
+		self.sent += 1
+		self.ingest.handle(topic, payload, retain)
+
+	def close(self, timeout):
+		''' Hand the queued records to the sinks and wait for their writers (WAL, RTDB writer) '''
+		deadline = time.monotonic() + timeout
+		for sink in self.sinks:
+			close = getattr(sink, 'close', None)
+			if close is not None:
+				close(max(deadline - time.monotonic(), 0))
+
+
+def replay(reader, target, remapper, speed, start=None, progress_interval=10):
+	first = None
+	began = time.monotonic()
+	progress_at = began + progress_interval
+	sent = 0
+	lag = 0.0
+	for timestamp, topic, payload, retain in reader.read(start):
+		if first is None:
+			first = timestamp
+		if speed:
+			due = began + (timestamp - first) / speed
+			now = time.monotonic()
+			if due > now:
+				time.sleep(due - now)
+				lag = 0.0
+			else:
+				lag = now - due
+		for copy_topic, copy_payload in remapper.messages(topic, payload):
+			target.send(copy_topic, copy_payload, retain)
+			sent += 1
+		if time.monotonic() >= progress_at:
+			progress_at = time.monotonic() + progress_interval
+			elapsed = time.monotonic() - began
+			logging.info('Replayed %d messages, %.0f msg/s, lag %.3f s', sent, sent / elapsed, lag)
+	return sent, time.monotonic() - began
+
+
+def main():
+	parser = argparse.ArgumentParser(description='Replay a capture file into a broker or the bridge sinks')
+	parser.add_argument('capture')
+	parser.add_argument('--config', default='../config.ini')
+	parser.add_argument('--broker', help='host:port to publish to, user and password of [mqtt]')
+	parser.add_argument('--sinks', help='comma separated bridge sinks to hand messages to: redis, influxdb, opcua')
+	parser.add_argument('--queued', action='store_true', help='run the sinks behind QueuedSink, like mqtt_bridge')
+	parser.add_argument('--speed', type=float, default=1.0, help='1 is recorded pace, N is N times faster, 0 is as fast as possible')
+	parser.add_argument('--copies', type=int, default=1, help='replay every message N times under remapped ids')
+	parser.add_argument('--remap', default='{id}_R{copy}', help='id format of the copies')
+	parser.add_argument('--start', type=float, default=0, help='skip the first seconds of the capture')
+	parser.add_argument('--loop', action='store_true', help='replay again and again')
+	parser.add_argument('--drain', type=float, default=30.0, help='seconds to wait at most for the writers at the end')
+	args = parser.parse_args()
+	if bool(args.broker) == bool(args.sinks):
+		parser.error('one of --broker and --sinks is required')
+
+	config = ConfigParser()
+	config.read(args.config)
+	if args.broker:
+		target = BrokerTarget(args.broker, config.get('mqtt', 'user', fallback='root'), config.get('mqtt', 'password', fallback='root'))
+	else:
+		names = [name.strip() for name in args.sinks.split(',') if name.strip()]
+		target = SinkTarget(config, names, args.queued, config.get('mqtt', 'json_backend', fallback='auto'))
+
+	reader = CaptureReader(args.capture)
+	first = reader.first_timestamp()
+	start = first + args.start if first is not None and args.start else None
+	remapper = Remapper(args.copies, args.remap)
+	began = time.monotonic()
+	try:
+		while True:
+			sent, elapsed = replay(reader, target, remapper, args.speed, start)
+			logging.info('Replayed %d messages in %.1f s, %.0f msg/s', sent, elapsed, sent / elapsed if elapsed > 0 else 0)
+			if not args.loop:
+				break
+	except KeyboardInterrupt:
+		pass
+	target.close(args.drain)
+	elapsed = time.monotonic() - began
+	logging.info('Delivered %d messages in %.1f s (writers drained), %.0f msg/s', target.sent, elapsed,
+				target.sent / elapsed if elapsed > 0 else 0)
+
+
+if __name__ == '__main__':
+	main()
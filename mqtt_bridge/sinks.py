@@ -0,0 +1,29 @@
+import os
+import sys
+
+
+''' Sink name -> (bridge directory, module with create_sink(config)) '''
+SINK_MODULES = {
+	'redis': ('mqtt_to_redis', 'rtdb.bridge'),
+	'influxdb': ('mqtt_to_influxdb', 'tsdb.bridge'),
+	'opcua': ('mqtt_to_opcua', 'ioe.bridge'),
+}
+
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def create_sink(config, name, instance=None, device_affinity=True):
+	''' Create the ingest sink of bridge name, instance is the worker name of shared workers
+	and device_affinity tells whether all samples of a device come to this worker
+	'''
+	if name not in SINK_MODULES:
+		raise ValueError('Invalid bridge sink: ' + name)
+	if name == 'opcua' and instance:
+		# Every OPC UA server needs all the data, it can not take a share of it
+		raise ValueError('Bridge sink opcua can not run in shared workers')
+	directory, module_name = SINK_MODULES[name]
+	sys.path.append(os.path.join(base_dir, directory))
+	module = __import__(module_name, fromlist=['create_sink'])
+	if name == 'influxdb':
+		return module.create_sink(config, instance=instance, device_affinity=device_affinity)
+	return module.create_sink(config)
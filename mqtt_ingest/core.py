@@ -0,0 +1,142 @@
+import time
+import logging
+from mqtt_ingest.jsonlib import make_loads
+from mqtt_ingest.inputs import InputTypes
+from mqtt_ingest.records import DataRecord, DeviceRecord, StatusRecord, EventRecord
+
+
+TOPICS = ('data', 'device', 'status', 'event')
+
+
+class Ingest:
+	''' Parse each MQTT message once into a record and hand it to the registered sinks
+
+	A sink is any object with some of on_data / on_device / on_status / on_event methods, each takes the record.
+	Records keep the retain flag, so every sink applies its own retain rules.
+	Only topics in sink_topics are handed to the on_* methods, device records always go to the optional
+	learn_device method, which keeps the sink local state (device types) and must not write anything out.
+	Topics without sinks are not parsed, except device which keeps the input types for data coercion.
+	'''
+	def __init__(self, json_backend='auto'):
+		self.json_backend, self.loads = make_loads(json_backend)
+		self.input_types = InputTypes()
+		self.sinks = []
+		self.sink_topics = TOPICS
+		self.parsers = {
+			'data': self.parse_data,
+			'device': self.parse_device,
+			'status': self.parse_status,
+			'event': self.parse_event,
+		}
+		self.dispatch = {}
+		self.data_filter = None
+		self.received = 0
+		self.failed = 0
+		self.compile()
+
+	def register(self, sink):
+		self.sinks.append(sink)
+		self.compile()
+		return sink
+
+	def set_sink_topics(self, topics):
+		self.sink_topics = tuple(topics)
+		self.compile()
+
+	def set_data_filter(self, data_filter):
+		''' data_filter(device) returns False for the devices whose data is skipped before parsing '''
+		self.data_filter = data_filter
+
+	def compile(self):
+		''' Build the topic -> (parser, sink methods) table used by the hot path '''
+		dispatch = {}
+		for topic in TOPICS:
+			names = ['on_' + topic] if topic in self.sink_topics else []
+			if topic == 'device':
+				names.append('learn_device')
+			methods = tuple(getattr(sink, name) for sink in self.sinks for name in names if hasattr(sink, name))
+			if methods or topic == 'device':
+				dispatch[topic] = (self.parsers[topic], methods)
+		self.dispatch = dispatch
+
+	def subscriptions(self):
+		return ['+/' + topic for topic in TOPICS if topic in self.dispatch]
+
+	# The paho on_message callback
+	def on_message(self, client, userdata, msg):
+		self.handle(msg.topic, msg.payload, msg.retain)
+
+	def handle(self, topic, payload, retain=0):
+		''' Return the record handed to sinks, None when the message is skipped '''
+		device, sep, kind = topic.partition('/')
+		entry = self.dispatch.get(kind)
+		if entry is None or not device:
+			return None
+		if kind == 'data' and self.data_filter is not None and not self.data_filter(device):
+			return None
+
+		self.received += 1
+		parser, methods = entry
+		try:
+			data = self.loads(payload)
+			if data:
+				record = parser(device, data, retain)
+			else:
+				record = None
+				logging.warning('Decode %s JSON failure: %s\t%r', kind.upper(), topic, payload)
+		except Exception as ex:
+			record = None
+			logging.warning('Decode %s failure: %s\t%r (%r)', kind.upper(), topic, payload, ex)
+		if record is None:
+			self.failed += 1
+			return None
+
+		for method in methods:
+			try:
+				method(record)
+			except Exception as ex:
+				logging.exception(ex)
+		return record
+
+	def parse_data(self, device, data, retain):
+		path = data['input']
+		input, sep, prop = path.partition('/')
+		dv = data['data']
+		value = dv[1]
+		vt = None
+		if not input or not prop:
+			# Kept for the sinks storing the raw path (RTDB), the ones needing input/property skip it
+			return DataRecord(device, path, None, path, None, value, dv[0], dv[2], dv, retain)
+		if prop == 'value':
+			try:
+				vt, value = self.input_types.coerce(device, input, value)
+			except (TypeError, ValueError, OverflowError) as ex:
+				logging.debug('Coerce %s/%s value %r failure (%r)', device, input, value, ex)
+		else:
+			value = str(value)
+		return DataRecord(device, input, prop, path, vt, value, dv[0], dv[2], dv, retain)
+
+	def parse_device(self, device, data, retain):
+		logging.debug('%s/device\t%s', device, data)
+		record = DeviceRecord(device, data.get('gate'), data['info'], retain)
+		self.input_types.update(record)
+		return record
+
+	def parse_status(self, device, data, retain):
+		status = data['status']
+		online = None
+		if status == "ONLINE" or status == "OFFLINE":
+			online = status == "ONLINE"
+		return StatusRecord(device, data.get('gate', device), status, online, time.time(), retain)
+
+	def parse_event(self, device, data, retain):
+		raw = data['event']
+		try:
+			event = self.loads(raw)
+			body = event[1]
+			timestamp = event[2] or time.time()
+		except Exception as ex:
+			logging.warning('Decode event body failure: %s\t%r (%r)', device, raw, ex)
+			body = None
+			timestamp = time.time()
+		return EventRecord(device, data.get('gate'), body, timestamp, raw, retain)
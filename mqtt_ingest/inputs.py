@@ -0,0 +1,28 @@
+class InputTypes:
+	''' Value types (vt) of device inputs, learned from device info and used to coerce input values '''
+	def __init__(self):
+		self.types = {}
+
+	def update(self, record):
+		for dev, dev_info in record.devices():
+			for it in dev_info.get('inputs') or []:
+				vt = it.get('vt')
+				name = it.get('name')
+				if vt and name:
+					self.types[(dev, name)] = vt
+
+	def get(self, device, input):
+		return self.types.get((device, input))
+
+	def coerce(self, device, input, value):
+		''' Return (vt, value), vt is None for the float values without type '''
+		if not isinstance(value, (int, float)):
+			return 'string', value
+
+		vt = self.types.get((device, input))
+		if vt == 'int':
+			return vt, int(value)
+		elif vt == 'string':
+			return vt, str(value)
+		else:
+			return None, float(value)
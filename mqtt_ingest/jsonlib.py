@@ -0,0 +1,42 @@
+import json
+import logging
+import importlib
+
+
+AUTO_BACKENDS = ('orjson', 'ujson', 'json')
+
+
+def load_backend(name='auto'):
+	''' Return (name, loads) of the JSON backend, auto picks the first installed of orjson, ujson and json '''
+	names = AUTO_BACKENDS if name in (None, '', 'auto') else (name,)
+	for backend in names:
+		if backend == 'json':
+			return 'json', json.loads
+		try:
+			module = importlib.import_module(backend)
+		except ImportError:
+			continue
+		return backend, module.loads
+	logging.warning('JSON backend %s is not installed, use json instead', name)
+	return 'json', json.loads
+
+
+def fallback_loads(payload):
+	''' The stdlib path of the original parsers, accepts what the fast backends refuse (lone surrogates, NaN, big ints) '''
+	if isinstance(payload, bytes):
+		payload = payload.decode('utf-8', 'surrogatepass')
+	return json.loads(payload)
+
+
+def make_loads(name='auto'):
+	backend, fast_loads = load_backend(name)
+	if backend == 'json':
+		return backend, fallback_loads
+
+	def loads(payload):
+		try:
+			return fast_loads(payload)
+		except ValueError:
+			return fallback_loads(payload)
+
+	return backend, loads
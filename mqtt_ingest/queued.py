@@ -0,0 +1,113 @@
+import time
+import heapq
+import logging
+import threading
+import collections
+
+
+CONTROL_METHODS = ('on_device', 'on_status', 'learn_device')
+
+
+class QueuedSink(threading.Thread):
+	''' Run a sink on its own thread behind bounded queues, so a slow sink does not stall the others
+
+	Records are handed to the sink in the order they were received. Data records are queued up to maxlen
+	and events up to event_maxlen, when full the oldest one is dropped (and counted). Device and status
+	records (and learn_device calls) are never dropped.
+	'''
+	def __init__(self, name, sink, maxlen=10240, event_maxlen=1024, stats_interval=60):
+		threading.Thread.__init__(self, name='QueuedSink-' + name)
+		self.daemon = True
+		self.sink = sink
+		self.maxlen = maxlen
+		self.event_maxlen = event_maxlen
+		self.stats_interval = stats_interval
+		self.lock = threading.Lock()
+		self.not_empty = threading.Condition(self.lock)
+		# Entries are (sequence, method, record), each queue is in sequence order
+		self.seq = 0
+		self.data = collections.deque()
+		self.events = collections.deque()
+		self.control = collections.deque()
+		self.admitted = 0
+		self.dropped = 0
+		self.events_dropped = 0
+		self.stats_dropped = 0
+		self.closing = False
+
+		if hasattr(sink, 'on_data'):
+			self.on_data = self.make_put(sink.on_data, 'data')
+		if hasattr(sink, 'on_event'):
+			self.on_event = self.make_put(sink.on_event, 'event')
+		for name in CONTROL_METHODS:
+			method = getattr(sink, name, None)
+			if method is not None:
+				setattr(self, name, self.make_put(method, 'control'))
+
+	def make_put(self, method, kind):
+		def put(record):
+			with self.lock:
+				self.seq += 1
+				entry = (self.seq, method, record)
+				if kind == 'data':
+					if len(self.data) >= self.maxlen:
+						self.data.popleft()
+						self.dropped += 1
+					self.data.append(entry)
+					self.admitted += 1
+				elif kind == 'event':
+					if len(self.events) >= self.event_maxlen:
+						self.events.popleft()
+						self.events_dropped += 1
+					self.events.append(entry)
+				else:
+					self.control.append(entry)
+				self.not_empty.notify()
+		return put
+
+	def stats(self):
+		with self.lock:
+			return {
+				"queued": len(self.data) + len(self.events) + len(self.control),
+				"admitted": self.admitted,
+				"dropped": self.dropped,
+				"events_dropped": self.events_dropped,
+			}
+
+	def close(self, timeout=30):
+		''' Hand the queued records to the sink, then close the sink (when it has close) within timeout seconds '''
+		deadline = time.monotonic() + timeout
+		with self.lock:
+			self.closing = True
+			self.not_empty.notify()
+		self.join(timeout)
+		close = getattr(self.sink, 'close', None)
+		if close is not None:
+			close(max(deadline - time.monotonic(), 0))
+
+	def run(self):
+		stats_at = time.monotonic() + self.stats_interval
+		while True:
+			with self.lock:
+				while not self.data and not self.events and not self.control:
+					if self.closing:
+						return
+					self.not_empty.wait(self.stats_interval)
+					if time.monotonic() >= stats_at:
+						break
+				queues = (self.control, self.events, self.data)
+				self.control, self.events, self.data = collections.deque(), collections.deque(), collections.deque()
+
+			# The queues are in sequence order, merge them back into the order of arrival
+			for seq, method, record in heapq.merge(*queues):
+				try:
+					method(record)
+				except Exception as ex:
+					logging.exception(ex)
+
+			if time.monotonic() >= stats_at:
+				stats_at = time.monotonic() + self.stats_interval
+				dropped = self.dropped + self.events_dropped
+				if dropped != self.stats_dropped:
+					self.stats_dropped = dropped
+					logging.warning('%s: %s', self.name, self.stats())
@@ -0,0 +1,97 @@
+class DataRecord:
+	''' One input sample from <device>/data
+
+	path is the raw "<input>/<property>" and data the raw [timestamp, value, quality] list (what the RTDB stores),
+	value is coerced by the input vt for the value property (kept as published when that fails) and a string
+	for the others. For a path without property, input is the path and property is None.
+	'''
+	__slots__ = ('device', 'input', 'property', 'path', 'vt', 'value', 'timestamp', 'quality', 'data', 'retain')
+
+	def __init__(self, device, input, property, path, vt, value, timestamp, quality, data, retain=0):
+		self.device = device
+		self.input = input
+		self.property = property
+		self.path = path
+		self.vt = vt
+		self.value = value
+		self.timestamp = timestamp
+		self.quality = quality
+		self.data = data
+		self.retain = retain
+
+	def __repr__(self):
+		return 'DataRecord(%s)' % ', '.join('%s=%r' % (k, getattr(self, k)) for k in self.__slots__)
+
+	@property
+	def typed_property(self):
+		''' "int_value" / "string_value" for typed values, the property itself otherwise '''
+		if self.vt:
+			return self.vt + '_' + self.property
+		return self.property
+
+
+class DeviceRecord:
+	''' Device info from <device>/device '''
+	__slots__ = ('device', 'gate', 'info', 'retain')
+
+	def __init__(self, device, gate, info, retain=0):
+		self.device = device
+		self.gate = gate
+		self.info = info
+		self.retain = retain
+
+	def __repr__(self):
+		return 'DeviceRecord(%s)' % ', '.join('%s=%r' % (k, getattr(self, k)) for k in self.__slots__)
+
+	def devices(self):
+		''' [(device, info)] of the message, info is either one device or a dict of devices '''
+		info = self.info
+		if not isinstance(info, dict):
+			return []
+		if 'meta' in info or 'inputs' in info:
+			return [(self.device, info)]
+		return [(dev, dev_info) for dev, dev_info in info.items() if isinstance(dev_info, dict)]
+
+	def device_types(self):
+		''' [(device, meta name)] '''
+		result = []
+		for dev, dev_info in self.devices():
+			meta = dev_info.get('meta')
+			if meta and meta.get('name'):
+				result.append((dev, meta.get('name')))
+		return result
+
+
+class StatusRecord:
+	''' Gateway status from <gate>/status, online is None for status other than ONLINE / OFFLINE '''
+	__slots__ = ('device', 'gate', 'status', 'online', 'timestamp', 'retain')
+
+	def __init__(self, device, gate, status, online, timestamp, retain=0):
+		self.device = device
+		self.gate = gate
+		self.status = status
+		self.online = online
+		self.timestamp = timestamp
+		self.retain = retain
+
+	def __repr__(self):
+		return 'StatusRecord(%s)' % ', '.join('%s=%r' % (k, getattr(self, k)) for k in self.__slots__)
+
+
+class EventRecord:
+	''' Device event from <device>/event
+
+	raw is the event JSON string as published, event the decoded event body (None when it can not be decoded).
+	'''
+	__slots__ = ('device', 'gate', 'event', 'timestamp', 'raw', 'retain')
+
+	def __init__(self, device, gate, event, timestamp, raw, retain=0):
+		self.device = device
+		self.gate = gate
+		self.event = event
+		self.timestamp = timestamp
+		self.raw = raw
+		self.retain = retain
+
+	def __repr__(self):
+		return 'EventRecord(%s)' % ', '.join('%s=%r' % (k, getattr(self, k)) for k in self.__slots__)
@@ -0,0 +1,98 @@
+import json
+import struct
+import logging
+
+try:
+	import msgpack
+except ImportError:
+	msgpack = None
+
+
+''' Real-time value [timestamp, value, quality] encodings in redis, written by mqtt_to_redis and read by mqtt_to_opcua.
+
+JSON text always starts with '[', the binary ones start with b'\x00' and a version byte:
+	version 1 (struct): type, timestamp (double), quality (int32), then value by type
+		'f' double, 'i' int64, 'b' bool byte, 'n' none, 's' utf-8 bytes
+	version 2 (msgpack): msgpack array
+'''
+MARKER = 0
+VERSION_STRUCT = 1
+VERSION_MSGPACK = 2
+HEADER = struct.Struct('<BBcdi')
+VALUE_FLOAT = struct.Struct('<d')
+VALUE_INT = struct.Struct('<q')
+INT64_MIN = -2 ** 63
+INT64_MAX = 2 ** 63 - 1
+
+
+def encode_struct(data):
+	ts, value, quality = data[0], data[1], data[2]
+	if not isinstance(ts, (int, float)) or not isinstance(quality, int) or not -2 ** 31 <= quality < 2 ** 31:
+		return None
+	if isinstance(value, bool):
+		return HEADER.pack(MARKER, VERSION_STRUCT, b'b', ts, quality) + (b'\x01' if value else b'\x00')
+	if isinstance(value, int):
+		if not INT64_MIN <= value <= INT64_MAX:
+			return None
+		return HEADER.pack(MARKER, VERSION_STRUCT, b'i', ts, quality) + VALUE_INT.pack(value)
+	if isinstance(value, float):
+		return HEADER.pack(MARKER, VERSION_STRUCT, b'f', ts, quality) + VALUE_FLOAT.pack(value)
+	if isinstance(value, str):
+		return HEADER.pack(MARKER, VERSION_STRUCT, b's', ts, quality) + value.encode('utf-8', 'surrogatepass')
+	if value is None:
+		return HEADER.pack(MARKER, VERSION_STRUCT, b'n', ts, quality)
+	return None
+
+
+def decode_struct(s):
+	marker, version, vt, ts, quality = HEADER.unpack_from(s)
+	body = s[HEADER.size:]
+	if vt == b'f':
+		value = VALUE_FLOAT.unpack(body)[0]
+	elif vt == b'i':
+		value = VALUE_INT.unpack(body)[0]
+	elif vt == b'b':
+		value = body == b'\x01'
+	elif vt == b's':
+		value = body.decode('utf-8', 'surrogatepass')
+	else:
+		value = None
+	return [ts, value, quality]
+
+
+class Codec:
+	def __init__(self, encoding='json'):
+		if encoding == 'msgpack' and not msgpack:
+			logging.warning('msgpack module is not installed, use struct RTDB encoding')
+			encoding = 'struct'
+		if encoding not in ('json', 'struct', 'msgpack'):
+			logging.warning('Unknown RTDB encoding %s, use json', encoding)
+			encoding = 'json'
+		self.encoding = encoding
+
+	def encode(self, data):
+		''' Encode [timestamp, value, quality], JSON is used for values the compact encoding can not keep '''
+		if self.encoding != 'json' and isinstance(data, list) and len(data) == 3:
+			if self.encoding == 'struct':
+				s = encode_struct(data)
+				if s is not None:
+					return s
+			else:
+				return bytes((MARKER, VERSION_MSGPACK)) + msgpack.packb(data)
+		return json.dumps(data)
+
+
+def decode(s):
+	''' Decode value of any encoding, s is bytes (or str from decode_responses clients for JSON) '''
+	if isinstance(s, str):
+		return json.loads(s)
+	if s[:1] != b'\x00':
+		return json.loads(s.decode('utf-8', 'surrogatepass'))
+	version = s[1]
+	if version == VERSION_STRUCT:
+		return decode_struct(s)
+	if version == VERSION_MSGPACK:
+		if not msgpack:
+			raise ValueError('msgpack module is required to decode value')
+		return msgpack.unpackb(s[2:])
+	raise ValueError('Unknown real-time value encoding version %d' % version)
@@ -0,0 +1,87 @@
+import zlib
+import argparse
+
+
+def worker_args(argv=None):
+	''' Return (worker, workers) of the command line, "--worker %(process_num)d --workers %(numprocs)d" in supervisor '''
+	parser = argparse.ArgumentParser()
+	parser.add_argument('--worker', type=int, default=0, help='index of this worker, worker 0 is the coordinator')
+	parser.add_argument('--workers', type=int, default=1, help='number of workers sharing the data topics')
+	args = parser.parse_args(argv)
+	if args.workers < 1 or not 0 <= args.worker < args.workers:
+		parser.error('worker index must be in [0, workers)')
+	return args.worker, args.workers
+
+
+class WorkerRole:
+	''' Place of one bridge process in a pool of workers sharing +/data
+
+	Every worker gets its share of data and all device info (for input types and device types).
+	The coordinator (worker 0) also hands device, status and event records to the sinks, the
+	other workers only data. With a single worker nothing is shared and it works as before.
+
+	dispatch is how +/data is shared:
+		broker: $share/<group>/+/data, the broker hands out the messages, each worker receives its share only.
+			Its default round-robin splits the samples of one device over workers, which breaks per-device
+			state (rollups, deadband, latest values), so the broker must dispatch by topic hash or sticky
+			(e.g. EMQX hash_topic strategy). broker_affinity tells that it does, per-device state is refused otherwise.
+		hash: fallback for brokers without such a strategy, every worker subscribes +/data and keeps the devices
+			of crc32(device) % count == index, so all samples of a device go to one worker. Each worker receives
+			and decodes all data, MQTT receive cost and broker egress grow with the worker count
+	'''
+	def __init__(self, client_id, index=0, count=1, group=None, dispatch='broker', broker_affinity=False):
+		if dispatch not in ('hash', 'broker'):
+			raise ValueError('Invalid share dispatch: ' + dispatch)
+		self.base_client_id = client_id
+		self.index = index
+		self.count = count
+		self.group = group or client_id
+		self.dispatch = dispatch
+		self.broker_affinity = broker_affinity
+		self.owned = {}
+
+	@property
+	def shared(self):
+		return self.count > 1
+
+	@property
+	def coordinator(self):
+		return self.index == 0
+
+	@property
+	def device_affinity(self):
+		''' True when all samples of a device come to the same worker as far as this process can tell '''
+		return not self.shared or self.dispatch == 'hash' or self.broker_affinity
+
+	@property
+	def client_id(self):
+		if not self.shared:
+			return self.base_client_id
+		return '%s_%d' % (self.base_client_id, self.index)
+
+	@property
+	def instance(self):
+		''' Name for per-worker local state (WAL, dead letters), None for a single worker '''
+		if not self.shared:
+			return None
+		return 'worker%d' % self.index
+
+	def owns(self, device):
+		owned = self.owned.get(device)
+		if owned is None:
+			owned = self.owned[device] = zlib.crc32(device.encode('utf-8')) % self.count == self.index
+		return owned
+
+	def apply(self, ingest):
+		if not self.coordinator:
+			ingest.set_sink_topics(['data'])
+		if self.shared and self.dispatch == 'hash':
+			ingest.set_data_filter(self.owns)
+
+	def subscriptions(self, ingest):
+		topics = []
+		for topic in ingest.subscriptions():
+			if self.shared and self.dispatch == 'broker' and topic == '+/data':
+				topic = '$share/%s/%s' % (self.group, topic)
+			topics.append(topic)
+		return topics
@@ -0,0 +1,84 @@
+''' Copy iot_device_event history into the indexed event measurement
+
+Usage (in mqtt_to_influxdb folder): python3 backfill_events.py [--start 2019-01-01] [--end 2019-10-01] [--chunk 86400]
+'''
+from __future__ import unicode_literals
+import sys
+import json
+import time
+import argparse
+import logging
+import datetime
+from configparser import ConfigParser
+from tsdb.client import Client
+from tsdb.events import make_event_point
+
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s', handlers=[logging.StreamHandler(sys.stdout)])
+
+
+def parse_time(s):
+	if s is None:
+		return None
+	return int(datetime.datetime.strptime(s, '%Y-%m-%d').replace(tzinfo=datetime.timezone.utc).timestamp())
+
+
+def first_event_time(client, measurement):
+	rs = client._client.query('SELECT first("event") FROM "{0}"'.format(measurement), epoch='s')
+	for row in rs.get_points():
+		return row['time']
+	return None
+
+
+def backfill(client, source, measurement, start, end, chunk):
+	total = 0
+	while start < end:
+		stop = min(start + chunk, end)
+		rs = client._client.query('SELECT * FROM "{0}" WHERE time >= {1}s AND time < {2}s'.format(source, start, stop), epoch='ms')
+		points = []
+		for row in rs.get_points():
+			try:
+				event = json.loads(row['event'])
+			except (TypeError, ValueError):
+				logging.warning('Skip invalid event %s %s', row.get('device'), row.get('event'))
+				continue
+			# Half a ms later, so that the ms timestamp survives float division and truncation
+			points.append(make_event_point(row['device'], (row['time'] + 0.5) / 1000, event, row.get('quality') or 0, measurement))
+		if points:
+			client.write_data(points)
+			total += len(points)
+		logging.info('Backfill %s ~ %s: %d events (total %d)',
+					datetime.datetime.utcfromtimestamp(start), datetime.datetime.utcfromtimestamp(stop), len(points), total)
+		start = stop
+	return total
+
+
+def main():
+	parser = argparse.ArgumentParser(description='Copy iot_device_event history into the indexed event measurement')
+	parser.add_argument('--config', default='../config.ini')
+	parser.add_argument('--start', help='UTC date YYYY-MM-DD, default is the first legacy event')
+	parser.add_argument('--end', help='UTC date YYYY-MM-DD, default is now')
+	parser.add_argument('--chunk', type=int, default=86400, help='seconds of events per query')
+	args = parser.parse_args()
+
+	config = ConfigParser()
+	config.read(args.config)
+	client = Client(host=config.get('influxdb', 'host', fallback='127.0.0.1'),
+					port=config.getint('influxdb', 'port', fallback=8086),
+					username=config.get('influxdb', 'username', fallback='root'),
+					password=config.get('influxdb', 'password', fallback='root'),
+					database=config.get('influxdb', 'database', fallback='thingsroot'))
+	client.connect()
+	measurement = config.get('influxdb', 'event_measurement', fallback='iot_device_events')
+
+	start = parse_time(args.start) or first_event_time(client, 'iot_device_event')
+	if start is None:
+		logging.info('No legacy events')
+		return
+	end = parse_time(args.end) or int(time.time()) + 1
+	total = backfill(client, 'iot_device_event', measurement, int(start), end, args.chunk)
+	logging.info('Backfill done, %d events copied into %s', total, measurement)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,71 @@
+''' Compare line protocol serializer with the dict points + influxdb.make_lines path
+
+Usage (in mqtt_to_influxdb folder): python3 -m bench.line_protocol [points]
+'''
+from __future__ import unicode_literals
+import sys
+import time
+import random
+from influxdb.line_protocol import make_lines
+from tsdb.line_protocol import Serializer
+from tsdb.point import Point
+
+
+def make_data(count, devices=100, inputs=40):
+	data_list = []
+	now = time.time()
+	for i in range(count):
+		r = random.random()
+		if r < 0.6:
+			prop, value = 'value', random.random() * 100
+		elif r < 0.9:
+			prop, value = 'int_value', random.randint(0, 65535)
+		else:
+			prop, value = 'string_value', 'status %d' % random.randint(0, 9)
+		data_list.append(Point('tag_%d' % (i % inputs), prop, 'GATE_%04d.DEV_%d' % ((i // inputs) % devices, i % 4),
+							now + i * 0.001, value, 0))
+	return data_list
+
+
+def dict_points(data_list):
+	''' The points building of Client.write_data before line protocol serializer '''
+	points = []
+	for data in data_list:
+		fields = {
+			data.property: data.value,
+			"quality": data.quality,
+		}
+		if data.level is not None and data.name == 'iot_device_event':
+			fields['level'] = data.level
+		points.append({
+			"measurement": data.name,
+			"tags": {
+				"device": data.device,
+			},
+			"time": int(data.timestamp * 1000),
+			"fields": fields
+		})
+	return make_lines({"points": points}, precision='ms').encode('utf-8')
+
+
+def run(name, func, data_list, rounds):
+	func(data_list)
+	start = time.perf_counter()
+	for i in range(rounds):
+		body = func(data_list)
+	cost = (time.perf_counter() - start) / rounds
+	print('%-12s %8.2f ms/batch %10.0f points/s %8d bytes' % (name, cost * 1000, len(data_list) / cost, len(body)))
+	return cost
+
+
+def main():
+	count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+	data_list = make_data(count)
+	serializer = Serializer()
+	old = run('dict', dict_points, data_list, 20)
+	new = run('line', serializer.serialize, data_list, 20)
+	print('speedup: %.1fx' % (old / new))
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,47 @@
+''' Bytes per queued point, dict records (before) vs Point records
+
+Usage (in mqtt_to_influxdb folder): python3 -m bench.point_memory [points]
+'''
+from __future__ import unicode_literals
+import sys
+import time
+import tracemalloc
+from tsdb.point import Point
+
+
+def make_dict(i, now):
+	return {
+		"name": 'tag_%d' % (i % 40),
+		"property": 'value',
+		"device": 'GATE_%04d.DEV_%d' % (i // 40 % 100, i % 4),
+		"timestamp": now + i,
+		"value": i * 0.5,
+		"quality": 0,
+	}
+
+
+def make_point(i, now):
+	return Point('tag_%d' % (i % 40), 'value', 'GATE_%04d.DEV_%d' % (i // 40 % 100, i % 4), now + i, i * 0.5, 0)
+
+
+def measure(name, func, count):
+	now = time.time()
+	tracemalloc.start()
+	before = tracemalloc.take_snapshot()
+	queued = [(48, func(i, now)) for i in range(count)]
+	after = tracemalloc.take_snapshot()
+	tracemalloc.stop()
+	size = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+	print('%-6s %10d bytes %8.1f bytes/point' % (name, size, size / len(queued)))
+	return size
+
+
+def main():
+	count = int(sys.argv[1]) if len(sys.argv) > 1 else 10240
+	old = measure('dict', make_dict, count)
+	new = measure('Point', make_point, count)
+	print('saved: %.1f%%' % ((old - new) * 100.0 / old))
+
+
+if __name__ == '__main__':
+	main()
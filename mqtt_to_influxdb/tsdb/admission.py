@@ -0,0 +1,60 @@
+import collections
+
+
+DROP_POLICIES = ('drop-oldest', 'drop-newest', 'sample')
+
+
+class Lane:
+	''' Bounded FIFO of (size, point) which never blocks the producer
+
+	When full the policy decides what is lost:
+		drop-oldest: evict the oldest point for the new one
+		drop-newest: reject the new point
+		sample: keep one of every sample_every new points (evicting the oldest), reject the others
+	maxlen 0 means unbounded, used by the lane which must always admit.
+	'''
+	def __init__(self, name, maxlen=0, policy='drop-oldest', sample_every=10):
+		if policy not in DROP_POLICIES:
+			raise ValueError('Invalid drop policy: ' + policy)
+		self.name = name
+		self.maxlen = maxlen
+		self.policy = policy
+		self.sample_every = max(sample_every, 1)
+		self.queue = collections.deque()
+		self.admitted = 0
+		self.dropped = 0
+		self.sampled = 0
+
+	def __len__(self):
+		return len(self.queue)
+
+	def put(self, item):
+		''' Return the size change of the lane '''
+		q = self.queue
+		if not self.maxlen or len(q) < self.maxlen:
+			q.append(item)
+			self.admitted += 1
+			return item[0]
+
+		if self.policy == 'drop-newest':
+			self.dropped += 1
+			return 0
+
+		if self.policy == 'sample':
+			self.sampled += 1
+			if self.sampled % self.sample_every != 0:
+				self.dropped += 1
+				return 0
+
+		size, point = q.popleft()
+		q.append(item)
+		self.admitted += 1
+		self.dropped += 1
+		return item[0] - size
+
+	def stats(self):
+		return {
+			"queued": len(self.queue),
+			"admitted": self.admitted,
+			"dropped": self.dropped,
+		}
@@ -0,0 +1,57 @@
+import os
+from tsdb.worker import Worker
+from tsdb.deadband import DeadbandFilter
+from tsdb.sink import InfluxDBSink
+
+
+def create_sink(config, instance=None, device_affinity=True):
+	''' Start the InfluxDB worker of [influxdb] settings and return the ingest sink feeding it
+
+	instance names the sub directory of WAL and dead letters for one of many worker processes.
+	device_affinity is False when the samples of one device may be split over worker processes,
+	rollups and deadband keep per-device state and are refused then.
+	'''
+	influxdb_host = config.get('influxdb', 'host', fallback='127.0.0.1')
+	influxdb_port = config.getint('influxdb', 'port', fallback=8086)
+	influxdb_user = config.get('influxdb', 'username', fallback='root')
+	influxdb_passowrd = config.get('influxdb', 'password', fallback='root')
+	influxdb_db = config.get('influxdb', 'database', fallback='thingsroot')
+	influxdb_batch_points = config.getint('influxdb', 'batch_points', fallback=5000)
+	influxdb_batch_bytes = config.getint('influxdb', 'batch_bytes', fallback=1024 * 1024)
+	influxdb_batch_linger = config.getfloat('influxdb', 'batch_linger', fallback=0.5)
+	influxdb_queue_size = config.getint('influxdb', 'queue_size', fallback=10240)
+	influxdb_event_queue_size = config.getint('influxdb', 'event_queue_size', fallback=1024)
+	influxdb_drop_policy = config.get('influxdb', 'drop_policy', fallback='drop-oldest')
+	influxdb_writers = config.getint('influxdb', 'writers', fallback=1)
+	influxdb_compression = config.get('influxdb', 'compression', fallback=None)
+	influxdb_compress_min_bytes = config.getint('influxdb', 'compress_min_bytes', fallback=1024)
+	influxdb_rollup_windows = config.get('influxdb', 'rollup_windows', fallback=None)
+	influxdb_dead_letter_dir = config.get('influxdb', 'dead_letter_dir', fallback=None)
+	influxdb_schema = config.get('influxdb', 'schema', fallback='point')
+	influxdb_merge_window = config.getfloat('influxdb', 'merge_window', fallback=0)
+	influxdb_event_schema = config.get('influxdb', 'event_schema', fallback='legacy')
+	influxdb_event_measurement = config.get('influxdb', 'event_measurement', fallback='iot_device_events')
+	influxdb_wal_dir = config.get('influxdb', 'wal_dir', fallback=None)
+	influxdb_wal_segment_size = config.getint('influxdb', 'wal_segment_size', fallback=16 * 1024 * 1024)
+	influxdb_wal_max_bytes = config.getint('influxdb', 'wal_max_bytes', fallback=1024 * 1024 * 1024)
+	if not device_affinity and (influxdb_rollup_windows or config.getboolean('deadband', 'enable', fallback=False)):
+		raise ValueError('rollup_windows and deadband need all samples of a device in one worker, '
+						'set [mqtt] share_affinity=true when the broker dispatches by topic hash, or share_dispatch=hash')
+	if instance and influxdb_wal_dir:
+		influxdb_wal_dir = os.path.join(influxdb_wal_dir, instance)
+	if instance and influxdb_dead_letter_dir:
+		influxdb_dead_letter_dir = os.path.join(influxdb_dead_letter_dir, instance)
+
+	db_worker = Worker(influxdb_db, influxdb_host, influxdb_port, influxdb_user, influxdb_passowrd,
+					batch_points=influxdb_batch_points, batch_bytes=influxdb_batch_bytes, batch_linger=influxdb_batch_linger,
+					queue_size=influxdb_queue_size, event_queue_size=influxdb_event_queue_size, drop_policy=influxdb_drop_policy,
+					writers=influxdb_writers,
+					compression=influxdb_compression, compress_min_bytes=influxdb_compress_min_bytes,
+					wal_dir=influxdb_wal_dir, wal_segment_size=influxdb_wal_segment_size, wal_max_bytes=influxdb_wal_max_bytes,
+					rollup_windows=influxdb_rollup_windows, dead_letter_dir=influxdb_dead_letter_dir,
+					schema=influxdb_schema, merge_window=influxdb_merge_window,
+					event_schema=influxdb_event_schema, event_measurement=influxdb_event_measurement)
+	db_worker.start()
+
+	deadband = DeadbandFilter(config)
+	return InfluxDBSink(db_worker, deadband)
@@ -3,16 +3,51 @@ from __future__ import unicode_literals
 import influxdb
 from influxdb.exceptions import InfluxDBClientError
 import logging
+import time
+import gzip
+import re
+from tsdb.line_protocol import Serializer
+from tsdb.quarantine import Quarantine, error_message, match_conflict
+
+try:
+	import zstandard
+except ImportError:
+	zstandard = None
+
+
+match_dropped = re.compile(r'dropped=(\d+)')
+
+
+def compress_level(size):
+	''' Bigger batch gets faster level, so that compressing time does not grow with batch size '''
+	if size < 64 * 1024:
+		return 6
+	if size < 1024 * 1024:
+		return 3
+	return 1
 
 
 class Client:
-	def __init__(	self, host, port, username, password, database):
+	def __init__(	self, host, port, username, password, database,
+					compression=None, compress_min_bytes=1024, stats_interval=300, quarantine=None, split_min=16):
 		self.host = host
 		self.port = port
 		self.username = username
 		self.password = password
 		self.database = database
 		self._client = None
+		self.quarantine = quarantine or Quarantine()
+		self._serializer = Serializer(field_types=self.quarantine.field_types)
+		if compression == 'zstd' and not zstandard:
+			logging.warning('zstandard module is not installed, use gzip compression')
+			compression = 'gzip'
+		if compression not in ('gzip', 'zstd'):
+			compression = None
+		self.compression = compression
+		self.compress_min_bytes = compress_min_bytes
+		self.stats_interval = stats_interval
+		self.split_min = max(split_min, 1)
+		self.reset_stats()
 
 	def connect(self):
 		self._client = influxdb.InfluxDBClient( host=self.host,
@@ -22,39 +57,85 @@ class Client:
 												database=self.database )
 
 	def write_data(self, data_list):
-		points = []
-		for data in data_list:
-			if data.get('level') is not None and data['name'] == 'iot_device_event':
-				points.append({
-					"measurement": data['name'],
-					"tags": {
-						"device": data['device'],
-					},
-					"time": int(data['timestamp'] * 1000),
-					"fields": {
-						data['property']: data['value'],
-						"quality": data['quality'],
-						"level": data['level']
-					}
-				})
-			else:
-				points.append({
-					"measurement": data['name'],
-					"tags": {
-						"device": data['device'],
-					},
-					"time": int(data['timestamp'] * 1000),
-					"fields": {
-						data['property']: data['value'],
-						"quality": data['quality'],
-					}
-				})
 		try:
-			self._client.write_points(points, time_precision='ms')
+			self.write_lines(self._serializer.serialize(data_list))
 		except InfluxDBClientError as ex:
-			if ex.code == 400:
-				logging.exception(ex)
+			if ex.code != 400:
+				raise
+			self.write_rejected(data_list, error_message(ex))
+
+	def write_rejected(self, data_list, message):
+		''' Split the rejected batch until the bad points are found, write the good ones
+
+		Only field type conflicts are split, down to split_min points. Other rejections, e.g. points beyond the
+		retention policy, or all points of the batch dropped, apply to the whole batch, which is quarantined at once.
+		'''
+		if self.quarantine.learn(message):
+			# Field type conflict learned, the coerced batch may be accepted as a whole
+			try:
+				self.write_lines(self._serializer.serialize(data_list))
 				return
+			except InfluxDBClientError as ex:
+				if ex.code != 400:
+					raise
+				message = error_message(ex)
+
+		dropped = match_dropped.search(message)
+		if (len(data_list) <= self.split_min or not match_conflict.search(message)
+				or (dropped and int(dropped.group(1)) >= len(data_list))):
+			self.quarantine.add(data_list, message)
+			return
+
+		half = len(data_list) // 2
+		for part in (data_list[:half], data_list[half:]):
+			try:
+				self.write_lines(self._serializer.serialize(part))
+			except InfluxDBClientError as ex:
+				if ex.code != 400:
+					raise
+				self.write_rejected(part, error_message(ex))
+
+	def write_lines(self, body):
+		headers = {'Content-Type': 'application/octet-stream'}
+		if self.compression and len(body) >= self.compress_min_bytes:
+			body = self.compress(body)
+			headers['Content-Encoding'] = self.compression
+		self._client.request(url="write",
+							method='POST',
+							params={'db': self.database, 'precision': 'ms'},
+							data=body,
+							expected_response_code=204,
+							headers=headers)
+
+	def compress(self, body):
+		start = time.thread_time()
+		level = compress_level(len(body))
+		if self.compression == 'zstd':
+			data = zstandard.ZstdCompressor(level=level).compress(body)
+		else:
+			data = gzip.compress(body, compresslevel=level)
+
+		self.stats_batches += 1
+		self.stats_raw_bytes += len(body)
+		self.stats_sent_bytes += len(data)
+		self.stats_cpu_time += time.thread_time() - start
+		if time.monotonic() - self.stats_start >= self.stats_interval:
+			self.log_stats()
+		return data
+
+	def reset_stats(self):
+		self.stats_start = time.monotonic()
+		self.stats_batches = 0
+		self.stats_raw_bytes = 0
+		self.stats_sent_bytes = 0
+		self.stats_cpu_time = 0.0
+
+	def log_stats(self):
+		if self.stats_raw_bytes > 0:
+			logging.info('InfluxDB %s compression: %d batches %d -> %d bytes, ratio %.3f, cpu %.3f ms/batch',
+						self.compression, self.stats_batches, self.stats_raw_bytes, self.stats_sent_bytes,
+						self.stats_sent_bytes / self.stats_raw_bytes, self.stats_cpu_time * 1000 / self.stats_batches)
+		self.reset_stats()
 
 	def create_database(self):
 		try:
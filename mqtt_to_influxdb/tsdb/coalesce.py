@@ -0,0 +1,51 @@
+from tsdb.point import Point
+
+
+# Typed values keep their own field, as in the point schema, so one field never gets values of different types
+TYPED_SUFFIXES = {'int_value': '_int', 'float_value': '_float', 'string_value': '_string'}
+SYSTEM_MEASUREMENTS = ('iot_device', 'device_status', 'iot_device_event')
+
+
+class Coalescer:
+	''' Merge input samples of one device within merge window into one multi-field point
+
+	The point goes to the device type (meta name) measurement, with one field per input ('<input>' for the value,
+	'<input>_int', '<input>_float', '<input>_string' for typed values, '<input>_<property>' for others).
+	Quality is only written as '<input>_quality' when it is not 0.
+	An input sampled more than once in the same window keeps the last sample.
+	'''
+	def __init__(self, window=0, measurement='iot_device_data'):
+		self.window = window
+		self.measurement = measurement
+		self.device_types = {}
+
+	def set_device_type(self, device, type_name):
+		self.device_types[device] = type_name
+
+	def coalesce(self, points):
+		out = []
+		merged = {}
+		window = self.window
+		for point in points:
+			if point.fields is not None or point.name in SYSTEM_MEASUREMENTS:
+				out.append(point)
+				continue
+
+			ts = point.timestamp
+			key = (point.device, int(ts / window) if window > 0 else ts)
+			group = merged.get(key)
+			if group is None:
+				measurement = self.device_types.get(point.device, self.measurement)
+				group = Point(measurement, 'coalesced', point.device, ts, None, None, fields={})
+				merged[key] = group
+				out.append(group)
+
+			property = point.property
+			if property == 'value':
+				field = point.name
+			else:
+				field = point.name + TYPED_SUFFIXES.get(property, '_' + property)
+			group.fields[field] = point.value
+			if point.quality:
+				group.fields[field + '_quality'] = point.quality
+		return out
@@ -0,0 +1,65 @@
+class DeadbandFilter:
+	''' Drop samples which are not changed more than deadband, keep one sample per max_silence seconds
+
+	Settings come from [deadband] section, and can be overridden per device type (meta name) in
+	[deadband:<type>] sections. A numeric change must exceed every configured deadband (absolute / percent
+	of last stored value), string/bool values are stored on any change.
+	'''
+	def __init__(self, config, section='deadband'):
+		self.enable = config.getboolean(section, 'enable', fallback=False)
+		self.default = self.load_settings(config, section, (0.0, 0.0, 300.0))
+		self.type_settings = {}
+		for name in config.sections():
+			if name.startswith(section + ':'):
+				self.type_settings[name[len(section) + 1:]] = self.load_settings(config, name, self.default)
+		self.device_types = {}
+		self.last = {}
+		self.passed = 0
+		self.dropped = 0
+
+	@staticmethod
+	def load_settings(config, section, default):
+		return (
+			config.getfloat(section, 'absolute', fallback=default[0]),
+			config.getfloat(section, 'percent', fallback=default[1]),
+			config.getfloat(section, 'max_silence', fallback=default[2]),
+		)
+
+	def set_device_type(self, device, type_name):
+		self.device_types[device] = type_name
+
+	def settings(self, device):
+		type_name = self.device_types.get(device)
+		if type_name is None:
+			return self.default
+		return self.type_settings.get(type_name, self.default)
+
+	def check(self, device, input, vt, value, quality, timestamp):
+		''' Return True when the sample should be stored '''
+		if not self.enable:
+			return True
+
+		key = (device, input)
+		last = self.last.get(key)
+		if last is None or quality != last[1] or self.changed(device, vt, last[0], value) \
+			or timestamp - last[2] >= self.settings(device)[2]:
+			self.last[key] = (value, quality, timestamp)
+			self.passed += 1
+			return True
+
+		self.dropped += 1
+		return False
+
+	def changed(self, device, vt, last_value, value):
+		if vt == 'string' or isinstance(value, (str, bool)) or isinstance(last_value, (str, bool)):
+			return value != last_value
+
+		absolute, percent, max_silence = self.settings(device)
+		delta = abs(value - last_value)
+		if absolute <= 0 and percent <= 0:
+			return delta > 0
+		if absolute > 0 and delta <= absolute:
+			return False
+		if percent > 0 and delta <= abs(last_value) * percent / 100:
+			return False
+		return True
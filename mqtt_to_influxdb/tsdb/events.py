@@ -0,0 +1,42 @@
+import json
+from tsdb.point import Point
+
+
+INDEXED_KEYS = ('type', 'level', 'info', 'app', 'data')
+
+
+def event_fields(event):
+	''' String fields of info, app and data (JSON unless a string), other attributes are kept as JSON in extra field '''
+	fields = {}
+	for key in ('info', 'app', 'data'):
+		value = event.get(key)
+		if value is not None:
+			fields[key] = value if isinstance(value, str) else json.dumps(value)
+	extra = dict((key, value) for key, value in event.items() if key not in INDEXED_KEYS)
+	level = event.get('level')
+	if level is not None and event_level(level) is None:
+		# Not an integer level, keep it rather than lose it
+		extra['level'] = level
+	if extra:
+		fields['extra'] = json.dumps(extra)
+	return fields
+
+
+def event_level(level):
+	try:
+		return int(level)
+	except (TypeError, ValueError):
+		return None
+
+
+def make_event_point(device, timestamp, event, quality, measurement='iot_device_events'):
+	''' Indexed event point, type is a tag and level an integer field, so both can be filtered without parsing '''
+	fields = event_fields(event)
+	fields['quality'] = quality
+	level = event_level(event.get('level'))
+	if level is not None:
+		fields['level'] = level
+	tags = {}
+	if event.get('type') is not None:
+		tags['type'] = str(event.get('type'))
+	return Point(measurement, 'event', device, timestamp, None, quality, fields=fields, tags=tags)
@@ -0,0 +1,131 @@
+import math
+
+
+def escape_tag(s):
+	return s.replace('\\', '\\\\').replace(',', '\\,').replace('=', '\\=').replace(' ', '\\ ').replace('\n', '\\n')
+
+
+def escape_string(s):
+	return '"' + s.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+
+
+def format_value(value):
+	''' Line protocol field value, None for the ones InfluxDB can not store '''
+	if isinstance(value, str):
+		return escape_string(value)
+	if isinstance(value, bool):
+		return 'true' if value else 'false'
+	if isinstance(value, int):
+		return '%di' % value
+	if isinstance(value, float):
+		if math.isnan(value) or math.isinf(value):
+			return None
+		return repr(value)
+	if value is None:
+		return None
+	return escape_string(str(value))
+
+
+def influx_type(value):
+	if isinstance(value, bool):
+		return 'boolean'
+	if isinstance(value, int):
+		return 'integer'
+	if isinstance(value, float):
+		return 'float'
+	return 'string'
+
+
+def coerce_value(value, field_type):
+	''' Convert value to the field type InfluxDB already has, None if it can not be done without loss '''
+	value_type = influx_type(value)
+	if value_type == field_type:
+		return value
+	if field_type == 'float' and value_type == 'integer':
+		return float(value)
+	if field_type == 'integer' and value_type == 'float' and value.is_integer():
+		return int(value)
+	if field_type == 'string':
+		return str(value)
+	return None
+
+
+class Serializer:
+	''' Turn worker Point records into line protocol bytes without building intermediate dicts '''
+	def __init__(self, cache_size=100000, field_types=None):
+		self.cache_size = cache_size
+		self.field_types = field_types if field_types is not None else {}
+		self.series_cache = {}
+		self.field_cache = {}
+
+	def series(self, name, device, tags=None):
+		key = (name, device, tuple(sorted(tags.items()))) if tags else (name, device)
+		series = self.series_cache.get(key)
+		if series is None:
+			if len(self.series_cache) >= self.cache_size:
+				self.series_cache.clear()
+			series = escape_tag(name) + ',device=' + escape_tag(device)
+			for tag, value in key[2] if tags else ():
+				if value is not None and value != '':
+					series += ',' + escape_tag(tag) + '=' + escape_tag(str(value))
+			series += ' '
+			self.series_cache[key] = series
+		return series
+
+	def field(self, key):
+		field = self.field_cache.get(key)
+		if field is None:
+			if len(self.field_cache) >= self.cache_size:
+				self.field_cache.clear()
+			field = escape_tag(key) + '='
+			self.field_cache[key] = field
+		return field
+
+	def line(self, data):
+		if self.field_types:
+			return self.typed_line(data)
+		fields = []
+		if data.fields is not None:
+			# Multiple fields point, e.g. rollup aggregates
+			for key, value in data.fields.items():
+				value = format_value(value)
+				if value is not None:
+					fields.append(self.field(key) + value)
+			return self.series(data.name, data.device, data.tags) + ','.join(fields) + ' %d' % int(data.timestamp * 1000)
+
+		value = format_value(data.value)
+		if value is not None:
+			fields.append(self.field(data.property) + value)
+		quality = format_value(data.quality)
+		if quality is not None:
+			fields.append('quality=' + quality)
+		if data.level is not None and data.name == 'iot_device_event':
+			fields.append('level=' + format_value(data.level))
+		return self.series(data.name, data.device, data.tags) + ','.join(fields) + ' %d' % int(data.timestamp * 1000)
+
+	def typed_line(self, data):
+		''' Line with values coerced to known field types, or moved to '<field>_<type>' field '''
+		if data.fields is not None:
+			pairs = data.fields.items()
+		else:
+			pairs = [(data.property, data.value), ('quality', data.quality)]
+			if data.level is not None and data.name == 'iot_device_event':
+				pairs.append(('level', data.level))
+
+		fields = []
+		for key, value in pairs:
+			field_type = self.field_types.get((data.name, key))
+			if field_type is not None:
+				coerced = coerce_value(value, field_type)
+				if coerced is None:
+					key = key + '_' + influx_type(value)
+				else:
+					value = coerced
+			value = format_value(value)
+			if value is not None:
+				fields.append(self.field(key) + value)
+		return self.series(data.name, data.device, data.tags) + ','.join(fields) + ' %d' % int(data.timestamp * 1000)
+
+	def serialize(self, data_list):
+		line = self.line
+		return '\n'.join([line(data) for data in data_list]).encode('utf-8')
@@ -0,0 +1,29 @@
+class Point:
+	''' One queued sample, __slots__ keeps it far smaller than the dict it replaces '''
+	__slots__ = ('name', 'property', 'device', 'timestamp', 'value', 'quality', 'level', 'type', 'fields', 'tags')
+
+	def __init__(self, name, property, device, timestamp, value, quality, level=None, type=None, fields=None, tags=None):
+		self.name = name
+		self.property = property
+		self.device = device
+		self.timestamp = timestamp
+		self.value = value
+		self.quality = quality
+		self.level = level
+		self.type = type
+		self.fields = fields
+		self.tags = tags
+
+	def __repr__(self):
+		return 'Point(%s)' % ', '.join('%s=%r' % (k, getattr(self, k)) for k in self.__slots__)
+
+	def to_list(self):
+		return [self.name, self.property, self.device, self.timestamp, self.value, self.quality, self.level, self.type, self.fields, self.tags]
+
+	@staticmethod
+	def from_list(data):
+		if isinstance(data, dict):
+			# Written by the dict based worker
+			return Point(data['name'], data['property'], data['device'], data['timestamp'], data.get('value'),
+						data.get('quality'), data.get('level'), data.get('type'), data.get('fields'), data.get('tags'))
+		return Point(*data)
@@ -0,0 +1,80 @@
+import os
+import re
+import json
+import time
+import threading
+import logging
+
+
+match_conflict = re.compile(r'input field "([^"]+)" on measurement "([^"]+)" is type (\w+), already exists as type (\w+)')
+
+DEAD_LETTER_FILE = 'dead_letter.jsonl'
+FIELD_TYPES_FILE = 'field_types.json'
+
+
+def error_message(ex):
+	content = getattr(ex, 'content', None) or str(ex)
+	if isinstance(content, bytes):
+		content = content.decode('utf-8', 'replace')
+	try:
+		return json.loads(content).get('error') or content
+	except (ValueError, AttributeError):
+		return content
+
+
+class Quarantine:
+	''' Dead-letter file for points InfluxDB rejects, and the known (measurement, field) types
+
+	Shared by all writers. The field types are what InfluxDB reported in field type conflicts,
+	the serializer uses them to coerce or re-route later points up front.
+	'''
+	def __init__(self, path=None):
+		self.path = path
+		self.lock = threading.Lock()
+		self.field_types = {}
+		if path:
+			os.makedirs(path, exist_ok=True)
+			self.load_field_types()
+
+	def load_field_types(self):
+		try:
+			with open(os.path.join(self.path, FIELD_TYPES_FILE), 'r') as f:
+				for item in json.load(f):
+					self.field_types[(item[0], item[1])] = item[2]
+		except FileNotFoundError:
+			pass
+		except Exception as ex:
+			logging.exception(ex)
+
+	def save_field_types(self):
+		tmp_path = os.path.join(self.path, FIELD_TYPES_FILE + '.tmp')
+		with open(tmp_path, 'w') as f:
+			json.dump([[k[0], k[1], v] for k, v in self.field_types.items()], f)
+		os.replace(tmp_path, os.path.join(self.path, FIELD_TYPES_FILE))
+
+	def learn(self, message):
+		''' Remember the field types of conflicts in error message, return True if there is a new one '''
+		learned = False
+		with self.lock:
+			for field, measurement, input_type, exists_type in match_conflict.findall(message):
+				key = (measurement, field)
+				if self.field_types.get(key) != exists_type:
+					logging.warning('InfluxDB field %s.%s is %s, %s values will be coerced', measurement, field, exists_type, input_type)
+					self.field_types[key] = exists_type
+					learned = True
+			if learned and self.path:
+				self.save_field_types()
+		return learned
+
+	def add(self, points, message):
+		logging.error('InfluxDB rejected %d points: %s', len(points), message)
+		if not self.path:
+			return
+		line = json.dumps({
+			"time": time.time(),
+			"error": message,
+			"points": [point.to_list() for point in points],
+		})
+		with self.lock:
+			with open(os.path.join(self.path, DEAD_LETTER_FILE), 'a') as f:
+				f.write(line + '\n')
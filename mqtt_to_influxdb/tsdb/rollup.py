@@ -0,0 +1,112 @@
+import time
+from tsdb.point import Point
+
+
+WINDOW_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+NUMERIC_PROPERTIES = ('value', 'int_value', 'float_value')
+
+
+def parse_windows(windows):
+	''' "1m,1h" -> [('1m', 60), ('1h', 3600)] '''
+	result = []
+	for label in (windows or '').split(','):
+		label = label.strip()
+		if not label:
+			continue
+		unit = WINDOW_UNITS.get(label[-1])
+		if unit is None:
+			raise ValueError('Invalid rollup window: ' + label)
+		result.append((label, int(label[:-1]) * unit))
+	return result
+
+
+class Rollup:
+	''' Streaming min/max/mean/last/count aggregators per (device, input, window)
+
+	Aggregates are written to '<input>_<window>' measurements (see measurement format), stamped with window start.
+	Windows follow the sample timestamps, which may lag the wall clock (buffered uploads, clock skew, replay),
+	so an open window expires once no sample came for window + grace seconds. A window is emitted once,
+	late samples of an emitted window are dropped and counted.
+	'''
+	def __init__(self, windows, measurement='{name}_{window}', grace=10):
+		self.windows = parse_windows(windows)
+		self.measurement = measurement
+		self.grace = grace
+		self.states = {}
+		self.closed = {}
+		self.names = {}
+		self.late = 0
+
+	def measurement_name(self, name, label):
+		key = (name, label)
+		measurement = self.names.get(key)
+		if measurement is None:
+			measurement = self.measurement.format(name=name, window=label)
+			self.names[key] = measurement
+		return measurement
+
+	def make_point(self, key, state):
+		start, vmin, vmax, vsum, count, last, quality, updated = state
+		return Point(self.measurement_name(key[1], key[2]), "rollup", key[0], start, None, quality, fields={
+			"min": vmin,
+			"max": vmax,
+			"mean": vsum / count,
+			"last": last,
+			"count": count,
+		})
+
+	def update(self, points):
+		''' Feed raw points, return aggregate points of the windows closed by them '''
+		out = []
+		states = self.states
+		closed = self.closed
+		now = time.monotonic()
+		for point in points:
+			if point.property not in NUMERIC_PROPERTIES:
+				continue
+			value = point.value
+			if isinstance(value, bool) or not isinstance(value, (int, float)):
+				continue
+			value = float(value)
+			ts = point.timestamp
+			for label, seconds in self.windows:
+				start = ts - ts % seconds
+				key = (point.device, point.name, label)
+				state = states.get(key)
+				if state is not None and state[0] != start:
+					if start < state[0]:
+						# Late sample of closed window
+						self.late += 1
+						continue
+					out.append(self.make_point(key, state))
+					closed[key] = state[0]
+					state = None
+				if state is None:
+					if start <= closed.get(key, start - 1):
+						# Late sample of emitted window, it is not opened again
+						self.late += 1
+						continue
+					states[key] = [start, value, value, value, 1, value, point.quality, now]
+					continue
+				if value < state[1]:
+					state[1] = value
+				if value > state[2]:
+					state[2] = value
+				state[3] += value
+				state[4] += 1
+				state[5] = value
+				state[6] = point.quality
+				state[7] = now
+		return out
+
+	def expire(self, now=None):
+		''' Close windows of inputs which stopped reporting (monotonic now) '''
+		now = now or time.monotonic()
+		out = []
+		windows = dict(self.windows)
+		for key, state in list(self.states.items()):
+			if state[7] + windows[key[2]] + self.grace <= now:
+				out.append(self.make_point(key, state))
+				self.closed[key] = state[0]
+				self.states.pop(key)
+		return out
@@ -0,0 +1,44 @@
+import json
+import time
+
+
+class InfluxDBSink:
+	''' Ingest sink queueing records into the InfluxDB worker, retained data and events are skipped '''
+	def __init__(self, worker, deadband):
+		self.worker = worker
+		self.deadband = deadband
+
+	def on_data(self, record):
+		if record.retain or record.property is None:
+			return
+		if self.worker.rollup is not None:
+			self.worker.append_rollup(name=record.input, property=record.typed_property, device=record.device,
+									timestamp=record.timestamp, value=record.value, quality=record.quality)
+		if record.property == 'value' and not self.deadband.check(record.device, record.input, record.vt, record.value,
+															record.quality, record.timestamp):
+			return
+		self.worker.append_data(name=record.input, property=record.typed_property, device=record.device,
+								timestamp=record.timestamp, value=record.value, quality=record.quality)
+
+	def close(self, timeout=30):
+		self.worker.close(timeout)
+
+	def on_device(self, record):
+		self.worker.append_data(name="iot_device", property="cfg", device=record.device, timestamp=time.time(),
+								value=json.dumps(record.info), quality=0, lane='control')
+
+	def learn_device(self, record):
+		for dev, type_name in record.device_types():
+			self.deadband.set_device_type(dev, type_name)
+			self.worker.set_device_type(dev, type_name)
+
+	def on_status(self, record):
+		if record.online is None:
+			return
+		self.worker.append_data(name="device_status", property="online", device=record.device, timestamp=record.timestamp,
+								value=record.online, quality=0, lane='control')
+
+	def on_event(self, record):
+		if record.retain or record.event is None:
+			return
+		self.worker.append_event(device=record.device, timestamp=record.timestamp, event=record.event, quality=0)
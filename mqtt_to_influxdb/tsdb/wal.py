@@ -0,0 +1,202 @@
+import os
+import mmap
+import json
+import zlib
+import struct
+import time
+import logging
+from tsdb.point import Point
+
+
+RECORD_HEADER = struct.Struct('<II')  # payload length, payload crc32
+SEGMENT_SUFFIX = '.wal'
+CHECKPOINT_FILE = 'checkpoint'
+
+
+class Segment:
+	def __init__(self, path, seq, size=None):
+		self.path = path
+		self.seq = seq
+		if size is not None:
+			with open(path, 'wb') as f:
+				f.truncate(size)
+		self.file = open(path, 'r+b')
+		self.size = os.fstat(self.file.fileno()).st_size
+		self.mm = mmap.mmap(self.file.fileno(), self.size)
+		self.end = self.scan(0)
+		self.dirty = False
+
+	def scan(self, offset):
+		''' Find the end of valid records, stop at zeroed space or torn write '''
+		while True:
+			data = self.read(offset)
+			if data is None:
+				return offset
+			offset += RECORD_HEADER.size + len(data)
+
+	def read(self, offset):
+		if offset + RECORD_HEADER.size > self.size:
+			return None
+		length, crc = RECORD_HEADER.unpack_from(self.mm, offset)
+		start = offset + RECORD_HEADER.size
+		if length == 0 or start + length > self.size:
+			return None
+		data = self.mm[start:start + length]
+		if zlib.crc32(data) != crc:
+			return None
+		return data
+
+	def append(self, data):
+		offset = self.end
+		if offset + RECORD_HEADER.size + len(data) > self.size:
+			return False
+		RECORD_HEADER.pack_into(self.mm, offset, len(data), zlib.crc32(data))
+		start = offset + RECORD_HEADER.size
+		self.mm[start:start + len(data)] = data
+		self.end = start + len(data)
+		self.dirty = True
+		return True
+
+	def flush(self):
+		if self.dirty:
+			self.mm.flush()
+			self.dirty = False
+
+	def close(self):
+		self.flush()
+		self.mm.close()
+		self.file.close()
+
+	def remove(self):
+		self.close()
+		os.remove(self.path)
+
+
+class WriteAheadLog:
+	''' Append-only segment files keeping batches which could not be written to InfluxDB
+
+	Appended records are synced to disk (msync) at most every flush_interval seconds, or by flush(True).
+	'''
+	def __init__(self, path, segment_size=16 * 1024 * 1024, max_bytes=1024 * 1024 * 1024, flush_interval=1.0):
+		self.path = path
+		self.segment_size = segment_size
+		self.max_bytes = max_bytes
+		self.flush_interval = flush_interval
+		self.flush_at = 0
+		self.segments = []
+		self.peek_size = 0
+		self.peek_seq = None
+		self.peek_offset = 0
+		os.makedirs(path, exist_ok=True)
+		for name in sorted(os.listdir(path)):
+			if name.endswith(SEGMENT_SUFFIX):
+				seq = int(name[:-len(SEGMENT_SUFFIX)])
+				self.segments.append(Segment(os.path.join(path, name), seq))
+		self.read_seq, self.read_offset = self.load_checkpoint()
+		self.skip_consumed()
+		if self.segments:
+			logging.info('WAL %s recovered %d segments, replay from %d:%d', path, len(self.segments), self.read_seq, self.read_offset)
+
+	def segment_path(self, seq):
+		return os.path.join(self.path, '%016d%s' % (seq, SEGMENT_SUFFIX))
+
+	def load_checkpoint(self):
+		try:
+			with open(os.path.join(self.path, CHECKPOINT_FILE), 'r') as f:
+				cp = json.load(f)
+			return cp['segment'], cp['offset']
+		except FileNotFoundError:
+			return 0, 0
+		except Exception as ex:
+			logging.exception(ex)
+			return 0, 0
+
+	def save_checkpoint(self):
+		tmp_path = os.path.join(self.path, CHECKPOINT_FILE + '.tmp')
+		with open(tmp_path, 'w') as f:
+			json.dump({"segment": self.read_seq, "offset": self.read_offset}, f)
+			f.flush()
+			os.fsync(f.fileno())
+		os.replace(tmp_path, os.path.join(self.path, CHECKPOINT_FILE))
+
+	def skip_consumed(self):
+		''' Remove segments replayed before checkpoint '''
+		while self.segments and self.segments[0].seq < self.read_seq:
+			self.segments.pop(0).remove()
+		if self.segments and self.segments[0].seq != self.read_seq:
+			self.read_seq, self.read_offset = self.segments[0].seq, 0
+
+	def disk_usage(self):
+		return sum(seg.size for seg in self.segments)
+
+	def empty(self):
+		if not self.segments:
+			return True
+		return len(self.segments) == 1 and self.read_offset >= self.segments[0].end
+
+	def append(self, points):
+		data = json.dumps([point.to_list() for point in points], separators=(',', ':')).encode('utf-8')
+		if self.segments and self.segments[-1].append(data):
+			self.flush()
+			return
+
+		if self.segments:
+			self.segments[-1].flush()
+		# Seal the active segment and start a new one within disk budget
+		size = max(self.segment_size, RECORD_HEADER.size + len(data))
+		while self.segments and self.disk_usage() + size > self.max_bytes:
+			seg = self.segments.pop(0)
+			logging.warning('WAL disk budget exceeded, drop segment %s', seg.path)
+			seg.remove()
+			if seg.seq == self.read_seq:
+				self.read_offset = 0
+				self.read_seq = self.segments[0].seq if self.segments else seg.seq + 1
+				self.save_checkpoint()
+
+		seq = self.segments[-1].seq + 1 if self.segments else max(self.read_seq, 0)
+		seg = Segment(self.segment_path(seq), seq, size)
+		self.segments.append(seg)
+		if len(self.segments) == 1:
+			self.read_seq, self.read_offset = seq, 0
+			self.save_checkpoint()
+		seg.append(data)
+		self.flush()
+
+	def flush(self, force=False):
+		''' Sync appended records to disk when flush_interval passed since the last sync '''
+		now = time.monotonic()
+		if not force and now < self.flush_at:
+			return
+		self.flush_at = now + self.flush_interval
+		for seg in self.segments:
+			seg.flush()
+
+	def peek(self):
+		''' Return the oldest not replayed batch or None '''
+		while self.segments:
+			seg = self.segments[0]
+			data = seg.read(self.read_offset)
+			if data is not None:
+				self.peek_size = RECORD_HEADER.size + len(data)
+				self.peek_seq, self.peek_offset = seg.seq, self.read_offset
+				return [Point.from_list(point) for point in json.loads(data.decode('utf-8'))]
+			if seg is self.segments[-1]:
+				return None
+			# Sealed segment fully replayed
+			self.segments.pop(0)
+			seg.remove()
+			self.read_seq, self.read_offset = self.segments[0].seq, 0
+			self.save_checkpoint()
+		return None
+
+	def commit(self):
+		''' Mark the batch returned by peek() as written
+
+		Appends between peek() and commit() may drop segments for the disk budget, the read position then
+		moved on and the peeked batch is gone already.
+		'''
+		peek_size, self.peek_size = self.peek_size, 0
+		if not peek_size or (self.read_seq, self.read_offset) != (self.peek_seq, self.peek_offset):
+			return
+		self.read_offset += peek_size
+		self.save_checkpoint()
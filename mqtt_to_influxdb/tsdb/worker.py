@@ -1,68 +1,221 @@
+import os
 import threading
-import queue
 import time
-import logging
 import json
+import zlib
+import logging
 import tsdb.client as tsdb
+from tsdb.writer import Writer
+from tsdb.rollup import Rollup
+from tsdb.admission import Lane
+from tsdb.point import Point
+from tsdb.quarantine import Quarantine
+from tsdb.coalesce import Coalescer
+from tsdb.events import make_event_point
+
+
+def point_size(point):
+	''' Rough line protocol size of one point, used for batch byte limit '''
+	value = point.value
+	size = len(point.name) + len(point.property) + len(point.device) + 48
+	if isinstance(value, str):
+		size += len(value)
+	else:
+		size += 16
+	if point.fields:
+		for key, value in point.fields.items():
+			size += len(key) + (len(value) if isinstance(value, str) else 16)
+	return size
 
 
 class Worker(threading.Thread):
-	def __init__(self, db, host, port, username, password):
-		threading.Thread.__init__(self)
-		client = tsdb.Client(database=db, host=host, port=port, username=username, password=password)
-		client.connect()
-		client.create_database()
-		self.client = client
-		self.data_queue = queue.Queue(10240)
-		self.task_queue = queue.Queue(1024)
+	def __init__(self, db, host, port, username, password,
+				batch_points=5000, batch_bytes=1024 * 1024, batch_linger=0.5,
+				queue_size=10240, event_queue_size=1024, drop_policy='drop-oldest', sample_every=10, stats_interval=60,
+				writers=1, compression=None, compress_min_bytes=1024,
+				wal_dir=None, wal_segment_size=16 * 1024 * 1024, wal_max_bytes=1024 * 1024 * 1024,
+				retry_min=1, retry_max=60, rollup_windows=None, rollup_grace=10, dead_letter_dir=None,
+				schema='point', merge_window=0, device_measurement='iot_device_data',
+				event_schema='legacy', event_measurement='iot_device_events'):
+		threading.Thread.__init__(self, name='InfluxDBWorker')
+		self.daemon = True
+		self.closing = False
+		writers = max(writers, 1)
+		quarantine = Quarantine(dead_letter_dir)
+		self.writers = []
+		for i in range(writers):
+			client = tsdb.Client(database=db, host=host, port=port, username=username, password=password,
+								compression=compression, compress_min_bytes=compress_min_bytes, quarantine=quarantine)
+			client.connect()
+			self.writers.append(Writer(i, client,
+								wal_dir=os.path.join(wal_dir, str(i)) if wal_dir else None,
+								wal_segment_size=wal_segment_size,
+								wal_max_bytes=wal_max_bytes // writers,
+								retry_min=retry_min, retry_max=retry_max))
+		self.writers[0].client.create_database()
+		self.shard_map = {}
+		self.rollup = None
+		self.rollup_lock = threading.Lock()
+		self.rollup_points = []
+		if rollup_windows:
+			self.rollup = Rollup(rollup_windows, grace=rollup_grace)
+		self.coalescer = None
+		if schema == 'device':
+			self.coalescer = Coalescer(merge_window, device_measurement)
+		self.event_schema = event_schema
+		self.event_measurement = event_measurement
+		self.batch_points = batch_points
+		self.batch_bytes = batch_bytes
+		self.batch_linger = batch_linger
+		# Lanes in priority order, status and device configurations are always admitted
+		self.lanes = {
+			"control": Lane("control"),
+			"event": Lane("event", event_queue_size, drop_policy, sample_every),
+			"data": Lane("data", queue_size, drop_policy, sample_every),
+		}
+		self.lane_order = list(self.lanes.values())
+		self.stats_interval = stats_interval
+		self.stats_dropped = 0
+		self.stats_rollup_late = 0
+		self.data_count = 0
+		self.data_bytes = 0
+		self.data_lock = threading.Lock()
+		self.data_not_empty = threading.Condition(self.data_lock)
 
 	def run(self):
-		dq = self.data_queue
-		tq = self.task_queue
-		client = self.client
+		for writer in self.writers:
+			writer.start()
+
+		rollup = self.rollup
+		expire_at = time.monotonic()
+		stats_at = time.monotonic() + self.stats_interval
 		while True:
-			time.sleep(0.5)
-			# Get data points from data queue
+			# Get data points from data queue, None once closed and drained
+			points = self.next_batch(1 if rollup else self.stats_interval)
+			closing = points is None
+			if closing:
+				points = []
+			if time.monotonic() >= stats_at:
+				stats_at = time.monotonic() + self.stats_interval
+				self.log_stats()
+			if rollup:
+				with self.rollup_lock:
+					if time.monotonic() >= expire_at:
+						expire_at = time.monotonic() + rollup.grace
+						self.rollup_points.extend(rollup.expire())
+					rollup_points, self.rollup_points = self.rollup_points, []
+				points.extend(rollup_points)
+			if len(points) > 0:
+				if self.coalescer:
+					points = self.coalescer.coalesce(points)
+				self.dispatch(points)
+			if closing:
+				return
+
+	def close(self, timeout=30):
+		''' Write the queued points and wait for the writers (failed batches go to WAL) within timeout seconds '''
+		deadline = time.monotonic() + timeout
+		with self.data_lock:
+			self.closing = True
+			self.data_not_empty.notify()
+		self.join(timeout)
+		for writer in self.writers:
+			writer.close(max(deadline - time.monotonic(), 0))
+
+	def set_device_type(self, device, type_name):
+		if self.coalescer:
+			self.coalescer.set_device_type(device, type_name)
+
+	def get_writer(self, device):
+		writer = self.shard_map.get(device)
+		if writer is None:
+			writer = self.writers[zlib.crc32(device.encode('utf-8')) % len(self.writers)]
+			self.shard_map[device] = writer
+		return writer
+
+	def dispatch(self, points):
+		''' Split batch by device, points of one device always go to the same writer '''
+		if len(self.writers) == 1:
+			self.writers[0].submit(points)
+			return
+
+		batches = {}
+		get_writer = self.get_writer
+		for point in points:
+			writer = get_writer(point.device)
+			batch = batches.get(writer)
+			if batch is None:
+				batches[writer] = batch = []
+			batch.append(point)
+		for writer, batch in batches.items():
+			writer.submit(batch)
+
+	def log_stats(self):
+		with self.data_lock:
+			stats = dict((lane.name, lane.stats()) for lane in self.lane_order)
+		dropped = sum(lane['dropped'] for lane in stats.values())
+		if dropped != self.stats_dropped:
+			self.stats_dropped = dropped
+			logging.warning('Worker queue lanes: %s', json.dumps(stats))
+		if self.rollup is not None and self.rollup.late != self.stats_rollup_late:
+			self.stats_rollup_late = self.rollup.late
+			logging.warning('Rollup late samples dropped: %d', self.rollup.late)
+
+	def batch_ready(self):
+		return self.data_count >= self.batch_points or self.data_bytes >= self.batch_bytes
+
+	def next_batch(self, timeout=None):
+		''' Block until batch_points/batch_bytes reached or batch_linger passed since first point queued '''
+		with self.data_lock:
+			while not self.data_count:
+				if self.closing:
+					return None
+				if not self.data_not_empty.wait(timeout) and timeout is not None:
+					return []
+
+			deadline = time.monotonic() + self.batch_linger
+			while not self.batch_ready() and not self.closing:
+				timeout = deadline - time.monotonic()
+				if timeout <= 0:
+					break
+				self.data_not_empty.wait(timeout)
+
+			# Drain the whole batch under single lock, higher priority lanes first
 			points = []
-			while not dq.empty():
-				points.append(dq.get())
-				dq.task_done()
+			size = 0
+			for lane in self.lane_order:
+				dq = lane.queue
+				while dq and len(points) < self.batch_points and size < self.batch_bytes:
+					item_size, point = dq.popleft()
+					size += item_size
+					points.append(point)
+			self.data_count -= len(points)
+			self.data_bytes -= size
+			return points
 
-			# append points into task queue
-			if len(points) > 0:
-				if tq.full():
-					tq.get()
-					tq.task_done()
-				tq.put(points)
-
-			# process tasks queue
-			while not tq.empty():
-				points = tq.get()
-				try:
-					client.write_data(points)
-					tq.task_done()
-				except Exception as ex:
-					logging.exception(ex)
-					#tq.queue.appendleft(points) #TODO: Keep the points writing to influxdb continuely.
-
-	def append_data(self, name, property, device, timestamp, value, quality):
-		self.data_queue.put({
-			"name": name,
-			"property": property,
-			"device": device,
-			"timestamp": timestamp,
-			"value": value,
-			"quality": quality,
-		})
+	def put_point(self, point, lane='data'):
+		''' Never blocks, the lane drop policy applies when it is full '''
+		item = (point_size(point), point)
+		lane = self.lanes[lane]
+		with self.data_lock:
+			was_empty = not self.data_count
+			count = len(lane)
+			self.data_bytes += lane.put(item)
+			self.data_count += len(lane) - count
+			if was_empty or self.batch_ready():
+				self.data_not_empty.notify()
+
+	def append_data(self, name, property, device, timestamp, value, quality, lane='data'):
+		self.put_point(Point(name, property, device, timestamp, value, quality), lane)
+
+	def append_rollup(self, name, property, device, timestamp, value, quality):
+		''' Feed a raw sample to the rollups, before deadband or lane drops, closed windows go with the next batch '''
+		with self.rollup_lock:
+			self.rollup_points.extend(self.rollup.update([Point(name, property, device, timestamp, value, quality)]))
 
 	def append_event(self, device, timestamp, event, quality):
-		self.data_queue.put({
-			"name": "iot_device_event",
-			"property": "event",
-			"device": device,
-			"timestamp": timestamp,
-			"value": json.dumps(event),
-			"quality": quality,
-			"level": event.get('level'),
-			"type": event.get('type'),
-		})
\ No newline at end of file
+		if self.event_schema == 'indexed':
+			self.put_point(make_event_point(device, timestamp, event, quality, self.event_measurement), 'event')
+			return
+		self.put_point(Point("iot_device_event", "event", device, timestamp, json.dumps(event), quality,
+							level=event.get('level'), type=event.get('type')), 'event')
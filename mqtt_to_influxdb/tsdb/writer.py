@@ -0,0 +1,130 @@
+import threading
+import queue
+import time
+import logging
+from tsdb.wal import WriteAheadLog
+
+
+class Writer(threading.Thread):
+	''' Write batches of a group of devices with its own InfluxDB client (keep-alive session) '''
+	def __init__(self, index, client, queue_size=1024,
+				wal_dir=None, wal_segment_size=16 * 1024 * 1024, wal_max_bytes=1024 * 1024 * 1024,
+				retry_min=1, retry_max=60):
+		threading.Thread.__init__(self, name='InfluxDBWriter-%d' % index)
+		self.daemon = True
+		self.index = index
+		self.client = client
+		self.task_queue = queue.Queue(queue_size)
+		self.wal = None
+		self.wal_lock = threading.Lock()
+		if wal_dir:
+			self.wal = WriteAheadLog(wal_dir, segment_size=wal_segment_size, max_bytes=wal_max_bytes)
+		self.retry_min = retry_min
+		self.retry_max = retry_max
+		self.retry_wait = 0
+		self.retry_at = 0
+
+	def submit(self, points):
+		''' Called from worker thread, never blocks '''
+		tq = self.task_queue
+		wal = self.wal
+		if wal:
+			with self.wal_lock:
+				# Keep writing order, all batches go to disk until WAL replayed
+				if tq.full() or not wal.empty():
+					wal.append(points)
+					return
+				tq.put_nowait(points)
+			return
+
+		if tq.full():
+			try:
+				logging.warning('Writer %d task queue is full, drop %d points', self.index, len(tq.get_nowait()))
+				tq.task_done()
+			except queue.Empty:
+				pass
+		tq.put_nowait(points)
+
+	def close(self, timeout=30):
+		''' Wait until the queued batches are written or spilled, then sync the WAL '''
+		deadline = time.monotonic() + timeout
+		tq = self.task_queue
+		with tq.all_tasks_done:
+			while tq.unfinished_tasks:
+				remaining = deadline - time.monotonic()
+				if remaining <= 0:
+					logging.warning('Writer %d closed with %d batches not written', self.index, tq.unfinished_tasks)
+					break
+				tq.all_tasks_done.wait(remaining)
+		if self.wal:
+			with self.wal_lock:
+				self.wal.flush(True)
+
+	def run(self):
+		tq = self.task_queue
+		while True:
+			# Wake up for replaying when backing off
+			timeout = None
+			if self.wal and not self.wal_empty():
+				timeout = max(min(self.retry_at - time.monotonic(), self.wal.flush_interval), 0.01)
+			try:
+				points = tq.get(timeout=timeout)
+			except queue.Empty:
+				points = None
+
+			if points is not None:
+				self.process(points)
+				tq.task_done()
+
+			if self.wal and time.monotonic() >= self.retry_at:
+				self.replay()
+			if self.wal:
+				with self.wal_lock:
+					self.wal.flush()
+
+	def wal_empty(self):
+		with self.wal_lock:
+			return self.wal.empty()
+
+	def write_failed(self):
+		self.retry_wait = min(max(self.retry_wait * 2, self.retry_min), self.retry_max)
+		self.retry_at = time.monotonic() + self.retry_wait
+		logging.warning('Writer %d write to InfluxDB failed, retry in %.1f seconds', self.index, self.retry_wait)
+
+	def process(self, points):
+		try:
+			self.client.write_data(points)
+			return
+		except Exception as ex:
+			logging.exception(ex)
+
+		wal = self.wal
+		if not wal:
+			return
+		# Spill the failed batch and the ones behind it
+		tq = self.task_queue
+		with self.wal_lock:
+			wal.append(points)
+			while not tq.empty():
+				wal.append(tq.get_nowait())
+				tq.task_done()
+			wal.flush(True)
+		self.write_failed()
+
+	def replay(self):
+		# Replay a few batches each round, so that new points keep flowing into WAL
+		wal = self.wal
+		for i in range(16):
+			with self.wal_lock:
+				points = wal.peek()
+			if points is None:
+				break
+			try:
+				self.client.write_data(points)
+			except Exception as ex:
+				logging.exception(ex)
+				self.write_failed()
+				return
+			with self.wal_lock:
+				wal.commit()
+			self.retry_wait = 0
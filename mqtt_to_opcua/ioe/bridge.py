@@ -0,0 +1,23 @@
+import redis
+from ioe.handler import MQTTHandler
+from ioe.mqtt_client import HandlerSink
+from ioe.user_api import UserApi
+
+
+def create_handler(config):
+	''' Start the OPC UA server and return its MQTT handler '''
+	redis_srv_url = config.get('redis', 'url', fallback='redis://127.0.0.1:6379')
+
+	redis_cfg = redis.Redis.from_url(redis_srv_url + "/10", decode_responses=True) # device defines
+	redis_rel = redis.Redis.from_url(redis_srv_url + "/11", decode_responses=True) # device relationship
+	redis_rtdb = redis.Redis.from_url(redis_srv_url + "/12") # device real-time data, values may be binary encoded
+
+	handler = MQTTHandler(redis_rtdb, redis_cfg, redis_rel, UserApi(config))
+	handler.start(warm_start=config.getboolean('opcua', 'warm_start', fallback=True),
+				warm_start_batch=config.getint('opcua', 'warm_start_batch', fallback=1000))
+	return handler
+
+
+def create_sink(config):
+	''' Start the OPC UA server and return the ingest sink feeding it '''
+	return HandlerSink(create_handler(config))
@@ -0,0 +1,269 @@
+import json
+import time
+import logging
+import datetime
+import threading
+from opcua import ua, Server
+from opcua.ua.uaerrors import UaStatusCodeError
+from mqtt_ingest import rtdb_codec
+from utils import _dict
+
+
+class OutputHandler:
+	def __init__(self, device, user_api):
+		self.device = device
+		self.user_api = user_api
+
+	def datachange_notification(self, node, val, data):
+		# Skip our own datachange events.
+		if val is None:
+			return
+
+		_node_bname = node.get_browse_name()
+		logging.info('**** Device %s output %s %s', self.device, _node_bname, repr(val))
+		r, action_id = self.user_api.send_output(self.device, _node_bname.Name, 'value', val)
+		if not r:
+			logging.warning('**** Send output failured %s', action_id)
+		# TODO: Watching result
+
+
+class MQTTHandler:
+	def __init__(self, redis_rtdb, redis_cfg, redis_rel, user_api):
+		self.redis_rtdb = redis_rtdb
+		self.redis_cfg = redis_cfg
+		self.redis_rel = redis_rel
+		self.user_api = user_api
+		self.devices = _dict({})
+		self.devices_sub_handle = _dict({})
+		self.device_types = _dict({})
+		self.device_nodes = {}
+		self.lock = threading.RLock()
+		self.loading = False
+
+	def start(self, warm_start=False, warm_start_batch=1000):
+		server = Server()
+		server.set_endpoint("opc.tcp://0.0.0.0:4840/thingsroot/server")
+		server.set_server_name("ThingsRoot Example OpcUA Server")
+		self.idx = server.register_namespace("http://opcua.thingsroot.com")
+		self.objects = server.get_objects_node()
+		self.server = server
+		self.devices = _dict({})
+		self.devices_sub_handle = _dict({})
+		self.device_types = _dict({})
+		self.device_nodes = {}
+		server.start()
+		if warm_start:
+			# Clients can connect while the devices kept in redis are loaded
+			self.loading = True
+			loader = threading.Thread(target=self.load_redis_db, args=(warm_start_batch,), name='OpcUaWarmStart')
+			loader.daemon = True
+			loader.start()
+
+	def load_redis_db(self, batch=1000, progress_interval=5):
+		''' Build the devices kept in redis, SCAN them in batches with one pipelined round trip per db and batch '''
+		start = time.monotonic()
+		progress_at = start + progress_interval
+		loaded = 0
+		scanned = 0
+		try:
+			total = self.redis_cfg.dbsize()
+			logging.info('Loading %d devices from redis', total)
+			keys = []
+			for key in self.redis_cfg.scan_iter(count=batch):
+				keys.append(key)
+				if len(keys) < batch:
+					continue
+				loaded += self.load_devices(keys)
+				scanned += len(keys)
+				keys = []
+				if time.monotonic() >= progress_at:
+					progress_at = time.monotonic() + progress_interval
+					logging.info('Loading devices from redis: %d / %d, %d built', scanned, total, loaded)
+			if keys:
+				loaded += self.load_devices(keys)
+				scanned += len(keys)
+		except Exception as ex:
+			logging.exception(ex)
+		finally:
+			self.loading = False
+		logging.info('Loaded %d devices (%d keys) from redis in %.1f s', loaded, scanned, time.monotonic() - start)
+		return loaded
+
+	def load_devices(self, keys):
+		infos = self.redis_cfg.mget(keys)
+		gates = self.redis_rel.mget(['PARENT_{0}'.format(sn) for sn in keys])
+		pipe = self.redis_rtdb.pipeline(transaction=False)
+		for sn in keys:
+			pipe.hgetall(sn)
+		values = pipe.execute()
+
+		loaded = 0
+		for sn, info, gate, hs in zip(keys, infos, gates, values):
+			if not info:
+				continue
+			try:
+				data = json.loads(info)
+			except ValueError:
+				data = None
+			if not data:
+				logging.warning('Decode Device Info Failure: %s\t%s', sn, info)
+				continue
+			with self.lock:
+				if sn in self.devices:
+					# Already (re)published by the gateway, which is newer than redis
+					continue
+				try:
+					self.build_device(sn, gate, data, values=hs)
+					loaded += 1
+				except Exception as ex:
+					logging.exception(ex)
+		return loaded
+
+	def stop(self):
+		self.server.stop()
+
+	def data(self, device, input, property, timestamp, value, quality):
+		nodes = self.device_nodes.get(device)
+		if nodes is None:
+			if not self.loading:
+				logging.warning('Device node does not exists %s', device)
+			return
+
+		if property != 'value':
+			return
+
+		node = nodes.get(input)
+		if not node:
+			logging.warning('Device input node does not exists %s/%s', device, input)
+			return
+
+		with self.lock:
+			self.set_value(node[1], value, timestamp)
+
+	@staticmethod
+	def set_value(node_data, value, timestamp):
+		datavalue = ua.DataValue(value)
+		datavalue.SourceTimestamp = datetime.datetime.utcfromtimestamp(timestamp)
+		#self.server.set_attribute_value(var.nodeid, datavalue)
+		#var.set_value(datavalue)
+		node_data.attributes[ua.AttributeIds.Value].value = datavalue
+
+	def index_nodes(self, dev_node, names):
+		''' Variable name -> (node, address space node data) of device, browsed once instead of per sample '''
+		aspace = self.server.iserver.aspace
+		nodes = {}
+		for name in names:
+			if name in nodes:
+				continue
+			try:
+				var = dev_node.get_child('%d:' % self.idx + name)
+			except UaStatusCodeError:
+				logging.warning('Device variable node does not exists %s', name)
+				continue
+			nodes[name] = (var, aspace._nodes[var.nodeid])
+		return nodes
+
+	def device(self, device, gate, info):
+		with self.lock:
+			return self.build_device(device, gate, info)
+
+	def build_device(self, device, gate, info, values=None):
+		self.del_device(device, gate)
+		meta = info.get('meta')
+		if not meta:
+			return
+		meta = _dict(meta)
+		dev = self.device_types.get(meta.name)
+		if dev:
+			inputs = info.get('inputs') or []
+			outputs = info.get('outputs') or []
+			commands = info.get('commands') or []
+			return self.add_device(dev, device, gate, inputs, outputs, commands, values)
+
+		dev = self.objects.add_object_type(self.idx, meta.name)
+
+		outputs = info.get('outputs') or []
+		output_names = []
+		for output in outputs:
+			output = _dict(output)
+			idv = 0.0
+			if output.vt == 'int':
+				idv = 0
+			if output.vt == 'string':
+				idv = ""
+
+			node = dev.add_variable(self.idx, output.name, None)
+			node.set_modelling_rule(True)
+			node.set_writable(True)
+			output_names.append(output.name)
+
+		inputs = info.get('inputs') or []
+		for input in inputs:
+			input = _dict(input)
+			if input.name not in output_names:
+				idv = 0.0
+				if input.vt == 'int':
+					idv = 0
+				if input.vt == 'string':
+					idv = ""
+
+				node = dev.add_variable(self.idx, input.name, None)
+				node.set_modelling_rule(True)
+				node.set_writable(False)
+
+		commands = info.get('commands') or []
+		for command in commands:
+			command = _dict(command)
+			ctrl = dev.add_object(self.idx, command.name)
+			ctrl.set_modelling_rule(True)
+			#ctrl.add_property(0, "state", "Idle").set_modelling_rule(True)
+
+		self.device_types[meta.name] = dev
+
+		return self.add_device(dev, device, gate, inputs, outputs, commands, values)
+
+	def del_device(self, device, gate):
+		self.device_nodes.pop(device, None)
+
+		handle = self.devices_sub_handle.get(device)
+		if handle:
+			self.devices_sub_handle.pop(device)
+			handle.delete()
+
+		dev_node = self.devices.get(device)
+		if dev_node:
+			try:
+				self.devices.pop(device)
+				dev_node.delete(delete_references=True, recursive=True)
+			except Exception as ex:
+				logging.exception(ex)
+
+	def add_device(self, dev_type_node, device, gate, inputs, outputs, commands, values=None):
+		dev_node = self.objects.add_object(self.idx, device, dev_type_node)
+		self.devices[device] = dev_node
+
+		input_names = [input.get('name') for input in inputs if input.get('name')]
+		output_names = [output.get('name') for output in outputs if output.get('name')]
+		nodes = self.index_nodes(dev_node, input_names + output_names)
+		self.device_nodes[device] = nodes
+
+		hs = values if values is not None else self.redis_rtdb.hgetall(device)
+		for name in input_names:
+			s = hs.get((name + "/value").encode('utf-8'))
+			node = nodes.get(name)
+			if s and node:
+				val = rtdb_codec.decode(s)
+				self.set_value(node[1], val[1], val[0])
+
+		handle = self.server.create_subscription(500, OutputHandler(device, self.user_api))
+		output_nodes = [nodes[name][0] for name in output_names if name in nodes]
+		if len(output_nodes) > 0:
+			handle.subscribe_data_change(output_nodes)
+			self.devices_sub_handle[device] = handle
+		return
+
+	def status(self, device, gate, online):
+		pass
+
+	def event(self, device, gate, timestamp, event):
+		pass
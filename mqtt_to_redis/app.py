@@ -1,14 +1,18 @@
 
 from __future__ import unicode_literals
-import re
 import os
 import sys
-import json
-import redis
 import logging
 from configparser import ConfigParser
 import paho.mqtt.client as mqtt
 
+# The shared mqtt_ingest package lives next to the application directories
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mqtt_ingest.core import Ingest
+from mqtt_ingest.shared import worker_args, WorkerRole
+from rtdb.bridge import create_sink
+
 
 console_out = logging.StreamHandler(sys.stdout)
 console_out.setLevel(logging.DEBUG)
@@ -27,19 +31,17 @@ mqtt_port = config.getint('mqtt', 'port', fallback=1883)
 mqtt_user = config.get('mqtt', 'user', fallback='root')
 mqtt_password = config.get('mqtt', 'password', fallback='root')
 mqtt_keepalive = config.getint('mqtt', 'keepalive', fallback=60)
+mqtt_json_backend = config.get('mqtt', 'json_backend', fallback='auto')
+mqtt_share_dispatch = config.get('mqtt', 'share_dispatch', fallback='broker')
+mqtt_share_affinity = config.getboolean('mqtt', 'share_affinity', fallback=False)
 
+worker_index, worker_count = worker_args()
+worker_role = WorkerRole("THINGSROOT_MQTT_TO_REDIS", worker_index, worker_count, dispatch=mqtt_share_dispatch,
+						broker_affinity=mqtt_share_affinity)
 
-redis_srv_url = config.get('redis', 'url', fallback='redis://127.0.0.1:6379')
-
-redis_sts = redis.Redis.from_url(redis_srv_url + "/9", decode_responses=True) # device status (online or offline)
-redis_cfg = redis.Redis.from_url(redis_srv_url + "/10", decode_responses=True) # device defines
-redis_rel = redis.Redis.from_url(redis_srv_url + "/11", decode_responses=True) # device relationship
-redis_rtdb = redis.Redis.from_url(redis_srv_url + "/12", decode_responses=True) # device real-time data
-
-''' Set all data be expired after device offline '''
-redis_offline_expire = 3600 * 24 * 7
-
-match_topic = re.compile(r'^([^/]+)/(.+)$')
+ingest = Ingest(json_backend=mqtt_json_backend)
+ingest.register(create_sink(config))
+worker_role.apply(ingest)
 
 
 # The callback for when the client receives a CONNACK response from the server.
@@ -53,99 +55,20 @@ def on_connect(client, userdata, flags, rc):
 
 	logging.info("Main MQTT Subscribe topics")
 	#client.subscribe("$SYS/#")
-	client.subscribe("+/data")
-	client.subscribe("+/device")
-	client.subscribe("+/status")
-	client.subscribe("+/event")
+	for topic in worker_role.subscriptions(ingest):
+		client.subscribe(topic)
 
 
 def on_disconnect(client, userdata, rc):
 	logging.error("Main MQTT Disconnect with result code "+str(rc))
 
 
-# The callback for when a PUBLISH message is received from the server.
-def on_message(client, userdata, msg):
-	g = match_topic.match(msg.topic)
-	if not g:
-		return
-	g = g.groups()
-	if len(g) < 2:
-		return
-
-	devid = g[0]
-	topic = g[1]
-
-	if topic == 'data':
-		if msg.retain != 0:
-			return
-		payload = json.loads(msg.payload.decode('utf-8', 'surrogatepass'))
-		if not payload:
-			logging.warning('Decode DATA JSON Failure: %s/%s\t%s', devid, topic, msg.payload.decode('utf-8', 'surrogatepass'))
-			return
-
-		# logging.debug('device: %s\tInput: %s\t Value: %s', g[0], g[1], json.dumps(payload))
-		r = redis_rtdb.hmset(devid, {
-			payload['input']: json.dumps(payload['data'])
-		})
-		return
-
-	if topic == 'device':
-		data = msg.payload.decode('utf-8', 'surrogatepass')
-		logging.debug('%s/%s\t%s', devid, topic, data)
-		info = json.loads(data)
-		if not info:
-			logging.warning('Decode JSON Failure: %s/%s\t%s', devid, topic, data)
-			return
-
-		gateid = info['gate']
-		devkeys = set(redis_rel.lrange(gateid, 0, 1000))
-		redis_rel.ltrim(gateid, 0, -1000)
-		devkeys.add(devid)
-		for key in devkeys:
-			redis_rel.lpush(gateid, key)
-
-		redis_rtdb.persist(devid)
-		redis_cfg.persist(devid)
-		redis_cfg.set(devid, json.dumps(info['info']))
-		redis_rel.persist('PARENT_{0}'.format(devid))
-		redis_rel.set('PARENT_{0}'.format(devid), gateid)
-
-		return
-
-	if topic == 'status':
-		gateid = devid
-		data = json.loads(msg.payload.decode('utf-8', 'surrogatepass'))
-		if not data:
-			logging.warning('Decode JSON Failure: %s/%s\t%s', devid, topic, data)
-			return
-
-		status = data['status']
-		redis_sts.set(gateid, status)
-		if status == 'OFFLINE':
-			redis_sts.expire(gateid, redis_offline_expire)
-			redis_rel.expire(gateid, redis_offline_expire)
-			devkeys = redis_rel.lrange(gateid, 0, 1000)
-			for dev in devkeys:
-				redis_cfg.expire(dev, redis_offline_expire)
-				redis_rtdb.expire(dev, redis_offline_expire)
-				redis_rel.expire('PARENT_{0}'.format(dev), redis_offline_expire)
-		else:
-			redis_sts.persist(gateid)
-			redis_rel.persist(gateid)
-
-		return
-
-	if topic == 'event':
-		data = json.loads(msg.payload.decode('utf-8', 'surrogatepass'))
-		return
-
-
 # Listen on MQTT forwarding real-time data into redis, and forwarding configuration to frappe.
-client = mqtt.Client(client_id="THINGSROOT_MQTT_TO_REDIS")
+client = mqtt.Client(client_id=worker_role.client_id)
 client.username_pw_set(mqtt_user, mqtt_password)
 client.on_connect = on_connect
 client.on_disconnect = on_disconnect
-client.on_message = on_message
+client.on_message = ingest.on_message
 
 try:
 	logging.debug('MQTT Connect to %s:%d', mqtt_host, mqtt_port)
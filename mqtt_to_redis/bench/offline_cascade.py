@@ -0,0 +1,82 @@
+''' Offline/online cascade of gateways: per key round trips (before) vs Relation.set_status pipelines
+
+Fills the given dbs (NOT the production 9-12 by default) with gateways x devices, then sets all gateways
+OFFLINE and ONLINE again with both ways.
+
+Usage (in mqtt_to_redis folder): python3 -m bench.offline_cascade [--url redis://127.0.0.1:6379] [--dbs 1,2,3,4]
+'''
+from __future__ import unicode_literals
+import time
+import argparse
+import redis
+from rtdb.relation import Relation
+
+
+def connect(url, dbs):
+	return [redis.Redis.from_url('{0}/{1}'.format(url, db), decode_responses=True) for db in dbs]
+
+
+def populate(sts, cfg, rel, rtdb, relation, gateways, devices):
+	for db in (sts, cfg, rel, rtdb):
+		db.flushdb()
+	for g in range(gateways):
+		gate = 'GATE_%05d' % g
+		pipes = [db.pipeline(transaction=False) for db in (cfg, rel, rtdb)]
+		for d in range(devices):
+			dev = '%s.DEV_%02d' % (gate, d)
+			pipes[0].set(dev, '{}')
+			relation.add_device_script(keys=[gate, relation.parent_key(dev)], args=[dev, gate], client=pipes[1])
+			pipes[2].hset(dev, mapping={'tag/value': '[0, 1, 0]'})
+		for pipe in pipes:
+			pipe.execute()
+		sts.set(gate, 'ONLINE')
+
+
+def legacy_set_status(sts, cfg, rel, rtdb, gate, status, expire):
+	''' The mqtt_to_redis on_message status handling before Relation.set_status '''
+	sts.set(gate, status)
+	if status == 'OFFLINE':
+		sts.expire(gate, expire)
+		rel.expire(gate, expire)
+		for dev in rel.smembers(gate):
+			cfg.expire(dev, expire)
+			rtdb.expire(dev, expire)
+			rel.expire('PARENT_{0}'.format(dev), expire)
+	else:
+		sts.persist(gate)
+		rel.persist(gate)
+
+
+def run(name, func, gateways):
+	start = time.perf_counter()
+	for status in ('OFFLINE', 'ONLINE'):
+		for g in range(gateways):
+			func('GATE_%05d' % g, status)
+	cost = time.perf_counter() - start
+	print('%-8s %8.3f s  %8.3f ms/gateway' % (name, cost, cost * 1000 / gateways / 2))
+	return cost
+
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument('--url', default='redis://127.0.0.1:6379')
+	parser.add_argument('--dbs', default='1,2,3,4', help='status, defines, relationship, real-time data dbs')
+	parser.add_argument('--gateways', type=int, default=1000)
+	parser.add_argument('--devices', type=int, default=50)
+	args = parser.parse_args()
+
+	dbs = [int(db) for db in args.dbs.split(',')]
+	sts, cfg, rel, rtdb = connect(args.url, dbs)
+	relation = Relation(rel, sts, cfg, rtdb)
+	print('Populate %d gateways x %d devices' % (args.gateways, args.devices))
+	populate(sts, cfg, rel, rtdb, relation, args.gateways, args.devices)
+
+	expire = 3600 * 24 * 7
+	old = run('legacy', lambda gate, status: legacy_set_status(sts, cfg, rel, rtdb, gate, status, expire), args.gateways)
+	new = run('pipeline', lambda gate, status: relation.set_status(gate, status, expire), args.gateways)
+	print('speedup: %.1fx' % (old / new))
+	assert cfg.ttl('GATE_00000.DEV_00') == -1 and rtdb.ttl('GATE_00000.DEV_00') == -1
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,42 @@
+import redis
+from rtdb.writer import Writer
+from rtdb.relation import Relation
+from mqtt_ingest.rtdb_codec import Codec
+from rtdb.history import History
+from rtdb.sink import RedisSink
+
+
+def create_sink(config):
+	''' Start the RTDB writer of [redis] settings and return the ingest sink feeding it '''
+	redis_srv_url = config.get('redis', 'url', fallback='redis://127.0.0.1:6379')
+	redis_flush_interval = config.getfloat('redis', 'flush_interval', fallback=0.005)
+	redis_flush_entries = config.getint('redis', 'flush_entries', fallback=1000)
+	redis_rtdb_encoding = config.get('redis', 'rtdb_encoding', fallback='json')
+	redis_notify_channel = config.get('redis', 'notify_channel', fallback=None)
+	redis_history_db = config.get('redis', 'history_db', fallback='').strip() # empty is disabled, 0 is a valid db
+	redis_history_maxlen = config.getint('redis', 'history_maxlen', fallback=1000)
+	redis_history_max_age = config.getint('redis', 'history_max_age', fallback=900)
+	redis_history_event_maxlen = config.getint('redis', 'history_event_maxlen', fallback=1000)
+
+	redis_sts = redis.Redis.from_url(redis_srv_url + "/9", decode_responses=True) # device status (online or offline)
+	redis_cfg = redis.Redis.from_url(redis_srv_url + "/10", decode_responses=True) # device defines
+	redis_rel = redis.Redis.from_url(redis_srv_url + "/11", decode_responses=True) # device relationship
+	redis_rtdb = redis.Redis.from_url(redis_srv_url + "/12", decode_responses=True) # device real-time data
+
+	rtdb_history = None
+	if redis_history_db:
+		redis_hist = redis.Redis.from_url(redis_srv_url + "/" + str(int(redis_history_db))) # device short-term history streams
+		rtdb_history = History(redis_hist, maxlen=redis_history_maxlen, max_age=redis_history_max_age, event_maxlen=redis_history_event_maxlen)
+
+	rtdb_codec = Codec(redis_rtdb_encoding)
+	rtdb_writer = Writer(redis_rtdb, flush_interval=redis_flush_interval, flush_entries=redis_flush_entries, history=rtdb_history,
+						notify_channel=redis_notify_channel)
+	rtdb_writer.start()
+
+	relation = Relation(redis_rel, redis_sts, redis_cfg, redis_rtdb)
+	relation.migrate()
+
+	''' Set all data be expired after device offline '''
+	redis_offline_expire = 3600 * 24 * 7
+
+	return RedisSink(rtdb_writer, relation, rtdb_codec, redis_rtdb, redis_cfg, redis_offline_expire)
@@ -0,0 +1,42 @@
+import time
+import logging
+
+
+class History:
+	''' Short-term history in capped Redis Streams, one stream per device and one 'EVENTS_<device>' stream for events
+
+	Streams are trimmed by approximate MAXLEN on every XADD, and by approximate MINID (entries older than max_age
+	seconds) on every flush. Streams of devices which stop reporting expire after max_age seconds.
+	'''
+	def __init__(self, redis_hist, maxlen=1000, max_age=900, event_maxlen=1000):
+		self.redis_hist = redis_hist
+		self.maxlen = maxlen
+		self.max_age = max_age
+		self.event_maxlen = event_maxlen
+
+	@staticmethod
+	def event_key(device):
+		return 'EVENTS_{0}'.format(device)
+
+	def flush(self, samples, events):
+		pipe = self.redis_hist.pipeline(transaction=False)
+		keys = set()
+		for device, input, value in samples:
+			pipe.xadd(device, {'input': input, 'value': value}, maxlen=self.maxlen, approximate=True)
+			keys.add(device)
+		for device, gate, event in events:
+			key = self.event_key(device)
+			# Field values must not be None, events may come without gate
+			pipe.xadd(key, {'gate': gate or '', 'event': event}, maxlen=self.event_maxlen, approximate=True)
+			keys.add(key)
+
+		if self.max_age:
+			minid = int((time.time() - self.max_age) * 1000)
+			for key in keys:
+				pipe.xtrim(key, minid=minid, approximate=True)
+				pipe.expire(key, self.max_age)
+
+		try:
+			pipe.execute()
+		except Exception as ex:
+			logging.exception(ex)
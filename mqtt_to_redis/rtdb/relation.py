@@ -0,0 +1,118 @@
+import logging
+
+
+''' Convert legacy list (LPUSH based, up to 1000 devices) into set '''
+LUA_CONVERT = '''
+local function convert(key)
+	if redis.call('TYPE', key).ok ~= 'list' then
+		return 0
+	end
+	local devs = redis.call('LRANGE', key, 0, -1)
+	local ttl = redis.call('PTTL', key)
+	redis.call('DEL', key)
+	for i = 1, #devs do
+		redis.call('SADD', key, devs[i])
+	end
+	if ttl > 0 then
+		redis.call('PEXPIRE', key, ttl)
+	end
+	return 1
+end
+'''
+
+''' KEYS[1]: gate, KEYS[2]: PARENT_<device>  ARGV[1]: device, ARGV[2]: gate '''
+LUA_ADD_DEVICE = LUA_CONVERT + '''
+convert(KEYS[1])
+redis.call('SADD', KEYS[1], ARGV[1])
+-- SADD keeps the expire time set when the gateway went offline
+redis.call('PERSIST', KEYS[1])
+redis.call('SET', KEYS[2], ARGV[2])
+return 1
+'''
+
+LUA_MIGRATE = LUA_CONVERT + '''
+return convert(KEYS[1])
+'''
+
+
+class Relation:
+	''' Gateway -> devices set and PARENT_<device> -> gateway keys in device relationship db
+
+	The status, defines and real-time data dbs are only needed by set_status.
+	'''
+	def __init__(self, redis_rel, redis_sts=None, redis_cfg=None, redis_rtdb=None):
+		self.redis_rel = redis_rel
+		self.redis_sts = redis_sts
+		self.redis_cfg = redis_cfg
+		self.redis_rtdb = redis_rtdb
+		self.add_device_script = redis_rel.register_script(LUA_ADD_DEVICE)
+		self.migrate_script = redis_rel.register_script(LUA_MIGRATE)
+
+	@staticmethod
+	def parent_key(device):
+		return 'PARENT_{0}'.format(device)
+
+	def add_device(self, gate, device):
+		''' Single round trip, the device set is persisted and the PARENT_ key by SET '''
+		self.add_device_script(keys=[gate, self.parent_key(device)], args=[device, gate])
+
+	def set_status(self, gate, status, expire):
+		''' Set gateway status, expire (OFFLINE) or persist the keys of gateway and its devices in all dbs
+
+		One pipeline reads the device set, then one pipeline per db, whatever the device count.
+		'''
+		offline = status == 'OFFLINE'
+
+		def touch(pipe, key):
+			if offline:
+				pipe.expire(key, expire)
+			else:
+				pipe.persist(key)
+
+		pipe = self.redis_rel.pipeline(transaction=False)
+		pipe.smembers(gate)
+		touch(pipe, gate)
+		devs = pipe.execute()[0]
+
+		pipes = []
+		pipe = self.redis_sts.pipeline(transaction=False)
+		pipe.set(gate, status)
+		touch(pipe, gate)
+		pipes.append(pipe)
+		if devs:
+			pipe = self.redis_rel.pipeline(transaction=False)
+			for dev in devs:
+				touch(pipe, self.parent_key(dev))
+			pipes.append(pipe)
+			for client in (self.redis_cfg, self.redis_rtdb):
+				pipe = client.pipeline(transaction=False)
+				for dev in devs:
+					touch(pipe, dev)
+				pipes.append(pipe)
+		for pipe in pipes:
+			pipe.execute()
+		return len(devs)
+
+	def migrate(self, batch=1000):
+		''' Convert all legacy gateway lists into sets '''
+		rel = self.redis_rel
+		converted = 0
+		keys = []
+		for key in rel.scan_iter(count=batch):
+			if key.startswith('PARENT_'):
+				continue
+			keys.append(key)
+			if len(keys) >= batch:
+				converted += self.migrate_keys(keys)
+				keys = []
+		if keys:
+			converted += self.migrate_keys(keys)
+		if converted:
+			logging.info('Converted %d gateway device lists into sets', converted)
+		return converted
+
+	def migrate_keys(self, keys):
+		pipe = self.redis_rel.pipeline(transaction=False)
+		for key in keys:
+			self.migrate_script(keys=[key], client=pipe)
+		return sum(pipe.execute())
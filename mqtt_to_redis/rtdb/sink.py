@@ -0,0 +1,42 @@
+import json
+import logging
+
+
+class RedisSink:
+	''' Ingest sink keeping real-time values, device defines and relationship in redis
+
+	Retained data and events are skipped, values are stored as published (the raw input path and data list).
+	'''
+	def __init__(self, writer, relation, codec, redis_rtdb, redis_cfg, offline_expire):
+		self.writer = writer
+		self.relation = relation
+		self.codec = codec
+		self.redis_rtdb = redis_rtdb
+		self.redis_cfg = redis_cfg
+		self.offline_expire = offline_expire
+
+	def close(self, timeout=30):
+		self.writer.close(timeout)
+
+	def on_data(self, record):
+		if record.retain:
+			return
+		self.writer.update(record.device, record.path, self.codec.encode(record.data))
+
+	def on_device(self, record):
+		if not record.gate:
+			logging.warning('Device %s info without gate', record.device)
+			return
+		self.relation.add_device(record.gate, record.device)
+
+		# SET clears the expire time of device defines
+		self.redis_rtdb.persist(record.device)
+		self.redis_cfg.set(record.device, json.dumps(record.info))
+
+	def on_status(self, record):
+		self.relation.set_status(record.device, record.status, self.offline_expire)
+
+	def on_event(self, record):
+		if record.retain:
+			return
+		self.writer.add_event(record.device, record.gate, record.raw)
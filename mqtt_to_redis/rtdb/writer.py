@@ -0,0 +1,141 @@
+import json
+import threading
+import time
+import logging
+
+
+class Writer(threading.Thread):
+	''' Keep the latest value per (device, input), write them by one pipelined HSET per device
+
+	Flushes every flush_interval seconds, or at once when flush_entries pending entries reached.
+	With history, every sample (not only the latest) and event are also appended to its streams on flush.
+	With notify_channel, the changed input names of each device are published as JSON array on
+	'<notify_channel>:<device>' once its values are written.
+	'''
+	def __init__(self, redis_rtdb, flush_interval=0.005, flush_entries=1000, stats_interval=60, history=None, notify_channel=None):
+		threading.Thread.__init__(self, name='RedisRTDBWriter')
+		self.daemon = True
+		self.redis_rtdb = redis_rtdb
+		self.flush_interval = flush_interval
+		self.flush_entries = flush_entries
+		self.stats_interval = stats_interval
+		self.lock = threading.Lock()
+		self.not_empty = threading.Condition(self.lock)
+		self.buffer = {}
+		self.entries = 0
+		self.updates = 0
+		self.history = history
+		self.notify_channel = notify_channel
+		self.samples = []
+		self.events = []
+		self.closing = False
+		self.reset_stats()
+
+	def update(self, device, input, value):
+		with self.lock:
+			values = self.buffer.get(device)
+			if values is None:
+				self.buffer[device] = values = {}
+			if input not in values:
+				self.entries += 1
+			values[input] = value
+			self.updates += 1
+			if self.history:
+				self.samples.append((device, input, value))
+			if self.entries == 1 or self.entries >= self.flush_entries:
+				self.not_empty.notify()
+
+	def add_event(self, device, gate, event):
+		if not self.history:
+			return
+		with self.lock:
+			self.events.append((device, gate, event))
+			if len(self.events) == 1 and not self.entries:
+				self.not_empty.notify()
+
+	def close(self, timeout=30):
+		''' Flush the pending values and events, wait for it up to timeout seconds '''
+		with self.lock:
+			self.closing = True
+			self.not_empty.notify()
+		self.join(timeout)
+		if self.is_alive():
+			logging.warning('RTDB writer closed with %d values not written', self.entries)
+
+	def run(self):
+		stats_at = time.monotonic() + self.stats_interval
+		while True:
+			with self.lock:
+				while not self.entries and not self.events:
+					if self.closing:
+						return
+					self.not_empty.wait()
+				if self.entries < self.flush_entries and not self.closing:
+					self.not_empty.wait(self.flush_interval)
+				buffer, self.buffer = self.buffer, {}
+				entries, self.entries = self.entries, 0
+				updates, self.updates = self.updates, 0
+				samples, self.samples = self.samples, []
+				events, self.events = self.events, []
+
+			if self.history:
+				self.history.flush(samples, events)
+
+			if buffer and not self.flush(buffer):
+				self.restore(buffer)
+				time.sleep(1)
+				continue
+
+			self.stats_flushes += 1
+			self.stats_entries += entries
+			self.stats_updates += updates
+			if time.monotonic() >= stats_at:
+				stats_at = time.monotonic() + self.stats_interval
+				self.log_stats()
+
+	def flush(self, buffer):
+		start = time.monotonic()
+		try:
+			pipe = self.redis_rtdb.pipeline(transaction=False)
+			for device, values in buffer.items():
+				pipe.hset(device, mapping=values)
+			if self.notify_channel:
+				# Commands of one connection are run in order, so PUBLISH comes after all HSET applied
+				for device, values in buffer.items():
+					pipe.publish(self.notify_channel + ':' + device, json.dumps(list(values)))
+			pipe.execute()
+		except Exception as ex:
+			logging.exception(ex)
+			return False
+		cost = time.monotonic() - start
+		self.stats_latency += cost
+		self.stats_latency_max = max(self.stats_latency_max, cost)
+		return True
+
+	def restore(self, buffer):
+		''' Put back the values of failed flush, unless newer ones arrived '''
+		with self.lock:
+			for device, values in buffer.items():
+				newer = self.buffer.get(device)
+				if newer is None:
+					self.buffer[device] = values
+					self.entries += len(values)
+					continue
+				for input, value in values.items():
+					if input not in newer:
+						newer[input] = value
+						self.entries += 1
+
+	def reset_stats(self):
+		self.stats_flushes = 0
+		self.stats_entries = 0
+		self.stats_updates = 0
+		self.stats_latency = 0.0
+		self.stats_latency_max = 0.0
+
+	def log_stats(self):
+		if self.stats_flushes > 0:
+			logging.info('RTDB flushes: %d, updates: %d, written: %d, coalescing ratio: %.2f, latency avg %.2f ms max %.2f ms',
+						self.stats_flushes, self.stats_updates, self.stats_entries, self.stats_updates / max(self.stats_entries, 1),
+						self.stats_latency * 1000 / self.stats_flushes, self.stats_latency_max * 1000)
+		self.reset_stats()